@@ -8,8 +8,17 @@
 #
 #
 
-from .commons import *
-from .mesh_combiner import *
+from .atlas_kernels import *
+
+try:
+	import bpy
+except ImportError:
+	# Вне Blender, например в процессах пула, доступны только atlas_kernels
+	bpy = None
+
+if bpy is not None:
+	from .commons import *
+	from .mesh_combiner import *
 
 bl_info = {
 	"name": "Kawashirov's Scripts",
@@ -0,0 +1,994 @@
+# Kawashirov's Scripts (c) 2019 by Sergey V. Kawashirov
+#
+# Kawashirov's Scripts is licensed under a
+# Creative Commons Attribution-NonCommercial-ShareAlike 3.0 Unported License.
+#
+# You should have received a copy of the license along with this
+# work.  If not, see <http://creativecommons.org/licenses/by-nc-sa/3.0/>.
+#
+#
+
+# Алгоритмы для атласа, которые не зависят ни от bpy, ни от mathutils:
+# работают только с float, списками и т.п.
+
+import bisect
+import hashlib
+import heapq
+import math
+import numpy
+import os
+import random
+import typing
+
+if typing.TYPE_CHECKING:
+	from typing import *
+	
+	T = TypeVar('T')
+	
+	Cell = Tuple[int, int]
+	CellRange = Tuple[int, int, int, int]
+	Box = Tuple[float, float, float, float]
+	# (min_x, min_y, max_x, max_y, [(индекс объекта в IslandsJob, [индексы полигонов]), ...])
+	RawIsland = Tuple[float, float, float, float, List[Tuple[int, List[int]]]]
+
+
+class BoxGrid:
+	# Пространственный индекс прямоугольников: равномерная разреженная сетка.
+	# Элемент регистрируется во всех ячейках, которые покрывает его прямоугольник.
+	# Слишком большие элементы не размазываются по сетке, а хранятся отдельно и попадают в кандидаты всегда.
+	
+	LARGE_CELLS = 256
+	
+	__slots__ = ('cell_size', 'cells', 'large', 'entries', 'counter')
+	
+	def __init__(self, cell_size: 'float'):
+		if not cell_size > 0:
+			raise ValueError("cell_size is not positive!", cell_size)
+		self.cell_size = float(cell_size)
+		self.cells = dict()  # type: Dict[Cell, Set[T]]
+		self.large = set()  # type: Set[T]
+		# элемент -> (порядковый номер вставки, диапазон ячеек или None для больших)
+		self.entries = dict()  # type: Dict[T, Tuple[int, Optional[CellRange]]]
+		self.counter = 0
+	
+	def __len__(self) -> 'int':
+		return len(self.entries)
+	
+	def __contains__(self, item: 'T') -> 'bool':
+		return item in self.entries
+	
+	def __iter__(self) -> 'Iterator[T]':
+		# В порядке вставки
+		entries = self.entries
+		return iter(sorted(entries.keys(), key=lambda item: entries[item][0]))
+	
+	def _cell_range(self, mnx: 'float', mny: 'float', mxx: 'float', mxy: 'float') -> 'CellRange':
+		cs = self.cell_size
+		return int(math.floor(mnx / cs)), int(math.floor(mny / cs)), int(math.floor(mxx / cs)), int(math.floor(mxy / cs))
+	
+	def order(self, item: 'T') -> 'int':
+		# Порядковый номер вставки: чем меньше, тем раньше элемент был добавлен
+		return self.entries[item][0]
+	
+	def insert(self, item: 'T', mnx: 'float', mny: 'float', mxx: 'float', mxy: 'float'):
+		if item in self.entries:
+			raise ValueError("item already in grid:", item)
+		cell_range = self._cell_range(mnx, mny, mxx, mxy)
+		ix0, iy0, ix1, iy1 = cell_range
+		if (ix1 - ix0 + 1) * (iy1 - iy0 + 1) > self.LARGE_CELLS:
+			self.large.add(item)
+			cell_range = None
+		else:
+			cells = self.cells
+			for ix in range(ix0, ix1 + 1):
+				for iy in range(iy0, iy1 + 1):
+					cell = cells.get((ix, iy))
+					if cell is None:
+						cell = set()
+						cells[(ix, iy)] = cell
+					cell.add(item)
+		self.entries[item] = (self.counter, cell_range)
+		self.counter += 1
+	
+	def remove(self, item: 'T'):
+		_, cell_range = self.entries.pop(item)
+		if cell_range is None:
+			self.large.discard(item)
+			return
+		ix0, iy0, ix1, iy1 = cell_range
+		cells = self.cells
+		for ix in range(ix0, ix1 + 1):
+			for iy in range(iy0, iy1 + 1):
+				cell = cells[(ix, iy)]
+				cell.discard(item)
+				if len(cell) == 0:
+					del cells[(ix, iy)]
+	
+	def query(self, mnx: 'float', mny: 'float', mxx: 'float', mxy: 'float') -> 'Set[T]':
+		# Кандидаты, чьи ячейки пересекаются с прямоугольником (закрытым).
+		# Это надмножество: точную проверку делает вызывающая сторона.
+		# Небольшой запас по краям, что бы погрешность float не теряла соседей на границе ячеек.
+		slack = self.cell_size * 1e-3
+		ix0, iy0, ix1, iy1 = self._cell_range(mnx - slack, mny - slack, mxx + slack, mxy + slack)
+		if (ix1 - ix0 + 1) * (iy1 - iy0 + 1) > len(self.entries):
+			# Проще перебрать все элементы, чем все ячейки
+			return set(self.entries.keys())
+		found = set(self.large)
+		cells = self.cells
+		for ix in range(ix0, ix1 + 1):
+			for iy in range(iy0, iy1 + 1):
+				cell = cells.get((ix, iy))
+				if cell is not None:
+					found.update(cell)
+		return found
+
+
+class UnionFind:
+	# Система непересекающихся множеств над индексами 0..size-1
+	__slots__ = ('parent', 'rank')
+	
+	def __init__(self, size: 'int'):
+		self.parent = list(range(size))  # type: List[int]
+		self.rank = [0] * size  # type: List[int]
+	
+	def find(self, i: 'int') -> 'int':
+		parent = self.parent
+		while parent[i] != i:
+			# Сокращение пути вдвое
+			parent[i] = parent[parent[i]]
+			i = parent[i]
+		return i
+	
+	def union(self, a: 'int', b: 'int') -> 'bool':
+		# Возвращает True, если множества были разными и объединились
+		a, b = self.find(a), self.find(b)
+		if a == b:
+			return False
+		if self.rank[a] < self.rank[b]:
+			a, b = b, a
+		self.parent[b] = a
+		if self.rank[a] == self.rank[b]:
+			self.rank[a] += 1
+		return True
+	
+	def groups(self) -> 'List[List[int]]':
+		# Группы в порядке первого элемента, элементы в группе по возрастанию
+		by_root = dict()  # type: Dict[int, List[int]]
+		groups = list()  # type: List[List[int]]
+		for i in range(len(self.parent)):
+			root = self.find(i)
+			group = by_root.get(root)
+			if group is None:
+				group = list()
+				by_root[root] = group
+				groups.append(group)
+			group.append(i)
+		return groups
+
+
+def connected_islands(
+		loop_starts: 'Sequence[int]', loop_totals: 'Sequence[int]',
+		loop_vertices: 'Sequence[int]', loop_uvs: 'Sequence[float]', epsilon: 'float' = 0
+) -> 'List[Tuple[float, float, float, float, List[int]]]':
+	# Разбивает полигоны на связные острова: два полигона связаны, если у них есть общая вершина,
+	# и UV этой вершины в обоих полигонах совпадает с точностью epsilon.
+	# loop_uvs - плоский список x0, y0, x1, y1, ... по всем лупам меша.
+	# Возвращает (min_x, min_y, max_x, max_y, индексы полигонов) для каждого острова,
+	# границы считаются один раз на готовый остров.
+	uf = UnionFind(len(loop_starts))
+	# вершина -> [(x, y, полигон), ...] уже встреченные лупы на этой вершине
+	at_vertex = dict()  # type: Dict[int, List[Tuple[float, float, int]]]
+	for poly in range(len(loop_starts)):
+		start = loop_starts[poly]
+		for loop in range(start, start + loop_totals[poly]):
+			x, y = loop_uvs[2 * loop], loop_uvs[2 * loop + 1]
+			vertex = loop_vertices[loop]
+			seen = at_vertex.get(vertex)
+			if seen is None:
+				at_vertex[vertex] = [(x, y, poly)]
+				continue
+			for sx, sy, spoly in seen:
+				if spoly != poly and abs(sx - x) <= epsilon and abs(sy - y) <= epsilon:
+					uf.union(spoly, poly)
+			seen.append((x, y, poly))
+	islands = list()  # type: List[Tuple[float, float, float, float, List[int]]]
+	for group in uf.groups():
+		mnx, mny, mxx, mxy = math.inf, math.inf, -math.inf, -math.inf
+		for poly in group:
+			start = loop_starts[poly]
+			for loop in range(start, start + loop_totals[poly]):
+				x, y = loop_uvs[2 * loop], loop_uvs[2 * loop + 1]
+				mnx, mny = min(mnx, x), min(mny, y)
+				mxx, mxy = max(mxx, x), max(mxy, y)
+		islands.append((mnx, mny, mxx, mxy, group))
+	return islands
+
+
+def polygons_loop_indices(
+		loop_starts: 'numpy.ndarray', loop_totals: 'numpy.ndarray'
+) -> 'Tuple[numpy.ndarray, numpy.ndarray]':
+	# Индексы лупов, уложенные подряд по полигонам, и смещения начала каждого полигона в них.
+	# Не полагается на то, что loop_start идут по возрастанию.
+	loop_totals = numpy.asarray(loop_totals, dtype=numpy.int64)
+	offsets = numpy.cumsum(loop_totals) - loop_totals
+	loop_indices = numpy.repeat(numpy.asarray(loop_starts, dtype=numpy.int64) - offsets, loop_totals)
+	loop_indices += numpy.arange(len(loop_indices), dtype=numpy.int64)
+	return loop_indices, offsets
+
+
+def polygons_bounds(
+		loop_uvs: 'numpy.ndarray', loop_starts: 'numpy.ndarray', loop_totals: 'numpy.ndarray'
+) -> 'Tuple[numpy.ndarray, numpy.ndarray]':
+	# Границы UV каждого полигона: массивы min и max формы (полигоны, 2).
+	# loop_uvs формы (лупы, 2), у каждого полигона должен быть хотя бы один луп.
+	if len(loop_starts) == 0:
+		empty = numpy.empty((0, 2), dtype=loop_uvs.dtype)
+		return empty, empty.copy()
+	loop_indices, offsets = polygons_loop_indices(loop_starts, loop_totals)
+	uvs = loop_uvs[loop_indices]
+	return numpy.minimum.reduceat(uvs, offsets, axis=0), numpy.maximum.reduceat(uvs, offsets, axis=0)
+
+
+# Боксы выше медианы во столько раз идут в sweep_merge_boxes отдельным списком, что бы не расширять поиск по Y для всех
+SWEEP_TALL_FACTOR = 4.0
+
+
+def _sweep_pass(boxes: 'List[Box]', epsilon: 'float', uf: 'UnionFind') -> 'bool':
+	# Один проход заметающей прямой по X. Активные боксы упорядочены по нижней границе Y (bisect),
+	# по этому для каждого бокса просматриваются только активные с ay0 в [gy0 - epsilon - max_h, gy1 + epsilon],
+	# где max_h - наибольшая высота обычного бокса. Выбывающие по X боксы снимаются через кучу по ax1.
+	# Редкие высокие боксы (выше SWEEP_TALL_FACTOR медиан) хранятся в отдельном списке и проверяются все.
+	count = len(boxes)
+	heights = sorted(box[3] - box[1] for box in boxes if box[3] > box[1])
+	cutoff = heights[len(heights) // 2] * SWEEP_TALL_FACTOR if len(heights) > 0 else 0.0
+	max_h = max((h for h in heights if h <= cutoff), default=0.0)
+	# Запас на округление при сравнении ay0 + max_h с ay1
+	reach = max_h * (1.0 + 1e-9) + 1e-9
+	merged = False
+	active = list()  # type: List[Tuple[float, int]]
+	expiry = list()  # type: List[Tuple[float, int]]
+	tall = list()  # type: List[int]
+	for g in sorted(range(count), key=lambda i: boxes[i][0]):
+		gx0, gy0, gx1, gy1 = boxes[g]
+		while len(expiry) > 0 and expiry[0][0] + epsilon < gx0:
+			_, a = heapq.heappop(expiry)
+			del active[bisect.bisect_left(active, (boxes[a][1], a))]
+		if len(tall) > 0:
+			tall = list(a for a in tall if boxes[a][2] + epsilon >= gx0)
+		lo = bisect.bisect_left(active, (gy0 - epsilon - reach, -1))
+		hi = bisect.bisect_right(active, (gy1 + epsilon, count))
+		for _, a in active[lo:hi]:
+			if gy0 <= boxes[a][3] + epsilon:
+				merged = uf.union(a, g) or merged
+		for a in tall:
+			if boxes[a][1] - epsilon <= gy1 and gy0 <= boxes[a][3] + epsilon:
+				merged = uf.union(a, g) or merged
+		if gy1 - gy0 > cutoff:
+			tall.append(g)
+		else:
+			bisect.insort(active, (gy0, g))
+			heapq.heappush(expiry, (gx1, g))
+	return merged
+
+
+def sweep_merge_boxes(
+		mnx: 'Sequence[float]', mny: 'Sequence[float]', mxx: 'Sequence[float]', mxy: 'Sequence[float]', epsilon: 'float' = 0
+) -> 'List[List[int]]':
+	# Сливает пересекающиеся (с точностью epsilon) боксы, пока сливать нечего.
+	# Каждый проход (_sweep_pass): заметающая прямая по X, пересекающиеся активные боксы объединяются через UnionFind.
+	# Проход O(n log n + k), где k - число пар пересекающихся по Y активных боксов.
+	# Возвращает группы индексов исходных боксов в порядке первого индекса, индексы в группах по возрастанию.
+	groups = list([i] for i in range(len(mnx)))  # type: List[List[int]]
+	boxes = list(zip(mnx, mny, mxx, mxy))  # type: List[Tuple[float, float, float, float]]
+	while True:
+		uf = UnionFind(len(boxes))
+		if not _sweep_pass(boxes, epsilon, uf):
+			break
+		new_groups, new_boxes = list(), list()
+		for uf_group in uf.groups():
+			new_groups.append(sorted(i for g in uf_group for i in groups[g]))
+			new_boxes.append((
+				min(boxes[g][0] for g in uf_group), min(boxes[g][1] for g in uf_group),
+				max(boxes[g][2] for g in uf_group), max(boxes[g][3] for g in uf_group),
+			))
+		# Порядок групп - по первому исходному индексу
+		order = sorted(range(len(new_groups)), key=lambda i: new_groups[i][0])
+		groups = list(new_groups[i] for i in order)
+		boxes = list(new_boxes[i] for i in order)
+	return groups
+
+
+# С какого числа кандидатов проверка пересечений делается одним векторным вызовом
+BATCH_INTERSECT_MIN = 16
+
+
+def box_intersect(a: 'Box', b: 'Box', epsilon: 'float' = 0) -> 'bool':
+	# Пересекаются ли (или касаются) боксы, если расширить их на epsilon. Симметрично.
+	return a[0] - epsilon <= b[2] and b[0] <= a[2] + epsilon and a[1] - epsilon <= b[3] and b[1] <= a[3] + epsilon
+
+
+def boxes_intersect(
+		box: 'Box', mnx: 'numpy.ndarray', mny: 'numpy.ndarray', mxx: 'numpy.ndarray', mxy: 'numpy.ndarray', epsilon: 'float' = 0
+) -> 'numpy.ndarray':
+	# Пакетная форма box_intersect: один бокс против многих, заданных массивами границ
+	return (box[0] - epsilon <= mxx) & (mnx <= box[2] + epsilon) & (box[1] - epsilon <= mxy) & (mny <= box[3] + epsilon)
+
+
+def grid_first_intersect(grid: 'BoxGrid', box: 'Box', get_box: 'Callable[[T], Box]', epsilon: 'float' = 0) -> 'Optional[T]':
+	# Первый (по порядку вставки) элемент сетки, пересекающийся с box
+	candidates = list(grid.query(box[0] - epsilon, box[1] - epsilon, box[2] + epsilon, box[3] + epsilon))
+	if len(candidates) >= BATCH_INTERSECT_MIN:
+		c_boxes = numpy.array(list(get_box(c) for c in candidates), dtype=numpy.float64)
+		mask = boxes_intersect(box, c_boxes[:, 0], c_boxes[:, 1], c_boxes[:, 2], c_boxes[:, 3], epsilon=epsilon)
+		candidates = list(c for c, hit in zip(candidates, mask.tolist()) if hit)
+	else:
+		candidates = list(c for c in candidates if box_intersect(get_box(c), box, epsilon=epsilon))
+	return min(candidates, key=grid.order) if len(candidates) > 0 else None
+
+
+class _BoxGroup:
+	# Сливаемый бокс и индексы исходных боксов, попавших в него
+	__slots__ = ('box', 'members')
+	
+	def __init__(self, box: 'Box', members: 'List[int]'):
+		self.box = box
+		self.members = members
+
+
+def merge_boxes_incremental(
+		boxes: 'Sequence[Box]', order: 'Iterable[int]', epsilon: 'float' = 0, cell_size: 'float' = 32.0
+) -> 'List[List[int]]':
+	# Повторяет IslandsBuilder.add_bbox на простых боксах: боксы добавляются по одному в порядке order,
+	# каждый сливается с первым (по порядку добавления) пересекающимся, пока пересечения находятся.
+	# Возвращает группы индексов боксов в порядке добавления групп.
+	grid = BoxGrid(cell_size)
+	for i in order:
+		to_add = _BoxGroup(tuple(boxes[i]), [i])
+		while to_add is not None:
+			b = to_add.box
+			target = grid_first_intersect(grid, b, lambda group: group.box, epsilon=epsilon)
+			if target is None:
+				grid.insert(to_add, *b)
+				to_add = None
+			else:
+				grid.remove(target)
+				t = target.box
+				target.box = (min(t[0], b[0]), min(t[1], b[1]), max(t[2], b[2]), max(t[3], b[3]))
+				target.members.extend(to_add.members)
+				to_add = target
+	return list(group.members for group in grid)
+
+
+class IslandsJob:
+	# Входные данные find_islands: все меши одного материала в виде массивов.
+	# Передаётся в другой процесс, по этому не содержит ничего из bpy.
+	__slots__ = ('mode', 'single_island', 'epsilon', 'cell_size', 'objects')
+	
+	def __init__(self, mode: 'str', single_island: 'bool', epsilon: 'float', cell_size: 'float'):
+		self.mode = mode
+		self.single_island = single_island
+		self.epsilon = epsilon
+		self.cell_size = cell_size
+		# (loop_uvs, loop_starts, loop_totals, loop_vertices, order) на каждый объект
+		self.objects = list()  # type: List[Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, Optional[numpy.ndarray], Optional[numpy.ndarray]]]
+	
+	def add_object(
+			self, loop_uvs: 'numpy.ndarray', loop_starts: 'numpy.ndarray', loop_totals: 'numpy.ndarray',
+			loop_vertices: 'Optional[numpy.ndarray]' = None, order: 'Optional[numpy.ndarray]' = None
+	):
+		# loop_uvs - уже в пикселях текстуры, loop_vertices нужен для CONNECTED, order (порядок полигонов) - для BBOX
+		self.objects.append((loop_uvs, loop_starts, loop_totals, loop_vertices, order))
+	
+	def get_loops_count(self) -> 'int':
+		return sum(len(obj[0]) for obj in self.objects)
+
+
+def find_islands(job: 'IslandsJob') -> 'List[RawIsland]':
+	# Поиск островов одного материала так же, как это делает KawaMeshCombiner.atlas_find_islands,
+	# но без bpy: подходит для запуска в пуле процессов.
+	epsilon, cell_size = job.epsilon, job.cell_size
+	# Элементы - это (индекс объекта, индекс полигона или None для всего объекта)
+	items = list()  # type: List[Tuple[int, Optional[int]]]
+	boxes = list()  # type: List[Box]
+	if job.single_island:
+		for ob_index, (loop_uvs, _, _, _, _) in enumerate(job.objects):
+			if len(loop_uvs) == 0:
+				continue
+			mn, mx = loop_uvs.min(axis=0).tolist(), loop_uvs.max(axis=0).tolist()
+			items.append((ob_index, None))
+			boxes.append((mn[0], mn[1], mx[0], mx[1]))
+		groups = merge_boxes_incremental(boxes, range(len(boxes)), epsilon=epsilon, cell_size=cell_size)
+	elif job.mode == 'CONNECTED':
+		# Компоненты связности, затем пересекающиеся (зеркальные, наложенные) компоненты сливаются в общий бокс,
+		# как IslandsBuilder.add_bboxes в atlas_find_islands
+		components = list()  # type: List[Tuple[int, List[int]]]
+		for ob_index, (loop_uvs, loop_starts, loop_totals, loop_vertices, _) in enumerate(job.objects):
+			for mnx, mny, mxx, mxy, polys in connected_islands(
+					loop_starts.tolist(), loop_totals.tolist(), loop_vertices.tolist(), loop_uvs.ravel().tolist(), epsilon=epsilon
+			):
+				components.append((ob_index, polys))
+				boxes.append((mnx, mny, mxx, mxy))
+		groups = sweep_merge_boxes(*zip(*boxes), epsilon=epsilon) if len(boxes) > 0 else list()
+		islands = list()  # type: List[RawIsland]
+		for group in groups:
+			per_ob = list()  # type: List[Tuple[int, List[int]]]
+			per_ob_index = dict()  # type: Dict[int, int]
+			for i in group:
+				ob_index, polys = components[i]
+				if ob_index not in per_ob_index:
+					per_ob_index[ob_index] = len(per_ob)
+					per_ob.append((ob_index, list()))
+				per_ob[per_ob_index[ob_index]][1].extend(polys)
+			islands.append((
+				min(boxes[i][0] for i in group), min(boxes[i][1] for i in group),
+				max(boxes[i][2] for i in group), max(boxes[i][3] for i in group),
+				per_ob,
+			))
+		return islands
+	else:
+		order = list()  # type: List[int]
+		for ob_index, (loop_uvs, loop_starts, loop_totals, _, ob_order) in enumerate(job.objects):
+			offset = len(items)
+			polys_mn, polys_mx = polygons_bounds(loop_uvs, loop_starts, loop_totals)
+			for poly, (mn, mx) in enumerate(zip(polys_mn.tolist(), polys_mx.tolist())):
+				items.append((ob_index, poly))
+				boxes.append((mn[0], mn[1], mx[0], mx[1]))
+			if ob_order is not None:
+				order.extend(offset + i for i in ob_order.tolist())
+			else:
+				order.extend(range(offset, len(items)))
+		if job.mode == 'SWEEP':
+			groups = sweep_merge_boxes(*zip(*boxes), epsilon=epsilon) if len(boxes) > 0 else list()
+		else:
+			groups = merge_boxes_incremental(boxes, order, epsilon=epsilon, cell_size=cell_size)
+	islands = list()
+	for group in groups:
+		per_ob = list()  # type: List[Tuple[int, List[int]]]
+		per_ob_index = dict()  # type: Dict[int, int]
+		for i in group:
+			ob_index, poly = items[i]
+			if ob_index not in per_ob_index:
+				per_ob_index[ob_index] = len(per_ob)
+				per_ob.append((ob_index, list()))
+			polys = per_ob[per_ob_index[ob_index]][1]
+			if poly is None:
+				polys.extend(range(len(job.objects[ob_index][1])))
+			else:
+				polys.append(poly)
+		islands.append((
+			min(boxes[i][0] for i in group), min(boxes[i][1] for i in group),
+			max(boxes[i][2] for i in group), max(boxes[i][3] for i in group),
+			per_ob,
+		))
+	return islands
+
+
+# Эвристики порядка боксов для упаковки
+PACK_HEURISTICS = ('HEIGHT', 'AREA', 'MAX_SIDE', 'WIDTH', 'PERIMETER')
+# Ширины полосы, которые пробует pack_boxes, в долях стороны квадрата с площадью всех боксов
+PACK_WIDTH_FACTORS = (1.0, 1.05, 1.1, 1.2, 1.35, 1.5)
+
+
+def pack_order(sizes: 'Sequence[Tuple[float, float]]', heuristic: 'str') -> 'List[int]':
+	# Порядок упаковки: от "крупных" боксов к мелким. При равенстве - по индексу, что бы результат был детерминированным.
+	if heuristic == 'HEIGHT':
+		key = lambda i: (-sizes[i][1], -sizes[i][0], i)
+	elif heuristic == 'AREA':
+		key = lambda i: (-sizes[i][0] * sizes[i][1], i)
+	elif heuristic == 'MAX_SIDE':
+		key = lambda i: (-max(sizes[i]), -min(sizes[i]), i)
+	elif heuristic == 'WIDTH':
+		key = lambda i: (-sizes[i][0], -sizes[i][1], i)
+	elif heuristic == 'PERIMETER':
+		key = lambda i: (-sizes[i][0] - sizes[i][1], i)
+	else:
+		raise ValueError("Unknown packing heuristic!", heuristic, PACK_HEURISTICS)
+	return sorted(range(len(sizes)), key=key)
+
+
+def skyline_pack(
+		sizes: 'Sequence[Tuple[float, float]]', order: 'Iterable[int]', width: 'float',
+		alt_sizes: 'Optional[Sequence[Tuple[float, float]]]' = None
+) -> 'Tuple[List[Tuple[float, float]], List[bool], float, float]':
+	# Упаковка по "горизонту" (skyline bottom-left) в полосу фиксированной ширины и неограниченной высоты.
+	# Бокс ставится туда, где его низ окажется ниже всего, при равенстве - левее.
+	# alt_sizes - размеры боксов, повёрнутых на 90°. Если заданы, пробуются обе ориентации,
+	# при одинаковом низе выбирается та, у которой ниже верх.
+	# Возвращает позиции и признаки поворота (в порядке sizes), занятые ширину и высоту.
+	tiny = width * 1e-9
+	positions = [(0.0, 0.0)] * len(sizes)  # type: List[Tuple[float, float]]
+	rotated = [False] * len(sizes)  # type: List[bool]
+	skyline = [(0.0, 0.0, float(width))]  # type: List[Tuple[float, float, float]]  # сегменты (x, y, w) слева направо
+	used_w, used_h = 0.0, 0.0
+	for i in order:
+		options = ((sizes[i], False), (alt_sizes[i], True)) if alt_sizes is not None else ((sizes[i], False),)
+		best_x, best_key, best_size, best_rotated = None, None, None, False
+		for (w, h), is_rotated in options:
+			for s in range(len(skyline)):
+				x = skyline[s][0]
+				if x + w > width + tiny:
+					break
+				# Высота, на которой ляжет бокс: максимум сегментов под ним
+				y, j, right = skyline[s][1], s + 1, x + w - tiny
+				while j < len(skyline) and skyline[j][0] < right:
+					y = max(y, skyline[j][1])
+					j += 1
+				key = (y, y + h)
+				if best_key is None or key < best_key:
+					best_x, best_key, best_size, best_rotated = x, key, (w, h), is_rotated
+		if best_x is None:
+			raise ValueError("Box is wider than strip!", i, sizes[i], width)
+		(w, h), best_y = best_size, best_key[0]
+		positions[i] = (best_x, best_y)
+		rotated[i] = best_rotated
+		used_w, used_h = max(used_w, best_x + w), max(used_h, best_y + h)
+		# Обновление горизонта: новый сегмент над боксом, перекрытые сегменты обрезаются
+		x0, x1 = best_x, best_x + w
+		updated = list()  # type: List[Tuple[float, float, float]]
+		for sx, sy, sw in skyline:
+			ex = sx + sw
+			if ex <= x0 + tiny or sx >= x1 - tiny:
+				if sx >= x1 - tiny and (len(updated) == 0 or updated[-1][0] < x0):
+					updated.append((x0, best_y + h, w))
+				updated.append((sx, sy, sw))
+				continue
+			if sx < x0 - tiny:
+				updated.append((sx, sy, x0 - sx))
+			if len(updated) == 0 or updated[-1][0] < x0:
+				updated.append((x0, best_y + h, w))
+			if ex > x1 + tiny:
+				updated.append((x1, sy, ex - x1))
+		# Соседние сегменты одной высоты склеиваются
+		skyline = list()
+		for segment in updated:
+			if len(skyline) > 0 and skyline[-1][1] == segment[1]:
+				last = skyline[-1]
+				skyline[-1] = (last[0], last[1], segment[0] + segment[2] - last[0])
+			else:
+				skyline.append(segment)
+	return positions, rotated, used_w, used_h
+
+
+def _min_strip_width(sizes: 'Sequence[Tuple[float, float]]', alt_sizes: 'Optional[Sequence[Tuple[float, float]]]') -> 'float':
+	# Самая узкая полоса, в которую влезает каждый бокс хотя бы в одной ориентации
+	if alt_sizes is None:
+		return max(w for w, _ in sizes)
+	return max(min(size[0], alt_size[0]) for size, alt_size in zip(sizes, alt_sizes))
+
+
+class PackResult:
+	# Результат pack_boxes: позиции боксов, повороты и занятая область
+	__slots__ = ('positions', 'rotated', 'width', 'height', 'fill', 'heuristic')
+	
+	def __init__(
+			self, positions: 'List[Tuple[float, float]]', rotated: 'List[bool]',
+			width: 'float', height: 'float', fill: 'float', heuristic: 'str'
+	):
+		self.positions = positions
+		self.rotated = rotated
+		self.width = width
+		self.height = height
+		# Доля площади квадрата score x score, занятая боксами
+		self.fill = fill
+		self.heuristic = heuristic
+	
+	def get_score(self) -> 'float':
+		# Сторона квадрата, в который влезла упаковка: чем меньше, тем лучше
+		return max(self.width, self.height)
+
+
+def pack_boxes(
+		sizes: 'Sequence[Tuple[float, float]]',
+		heuristics: 'Iterable[str]' = PACK_HEURISTICS, width_factors: 'Iterable[float]' = PACK_WIDTH_FACTORS,
+		alt_sizes: 'Optional[Sequence[Tuple[float, float]]]' = None
+) -> 'PackResult':
+	# Детерминированная упаковка боксов в квадрат минимальной стороны:
+	# skyline_pack для каждой эвристики порядка и каждой ширины полосы, выбирается лучший результат.
+	# alt_sizes - размеры повёрнутых боксов, если поворот разрешён.
+	if len(sizes) == 0:
+		return PackResult(list(), list(), 0.0, 0.0, 0.0, '')
+	area = sum(w * h for w, h in sizes)
+	min_width = _min_strip_width(sizes, alt_sizes)
+	best = None  # type: Optional[PackResult]
+	for heuristic in heuristics:
+		order = pack_order(sizes, heuristic)
+		for factor in width_factors:
+			width = max(min_width, math.sqrt(area) * factor)
+			positions, rotated, used_w, used_h = skyline_pack(sizes, order, width, alt_sizes=alt_sizes)
+			score = max(used_w, used_h)
+			if best is None or score < best.get_score():
+				best = PackResult(positions, rotated, used_w, used_h, area / (score * score) if score > 0 else 0.0, heuristic)
+	return best
+
+
+# Основной критерий каждой эвристики, для случайных испытаний
+_PACK_HEURISTIC_KEYS = {
+	'HEIGHT': lambda w, h: h,
+	'AREA': lambda w, h: w * h,
+	'MAX_SIDE': lambda w, h: max(w, h),
+	'WIDTH': lambda w, h: w,
+	'PERIMETER': lambda w, h: w + h,
+}
+
+
+def pack_trial(
+		sizes: 'Sequence[Tuple[float, float]]', trial: 'int', alt_sizes: 'Optional[Sequence[Tuple[float, float]]]' = None
+) -> 'PackResult':
+	# Одно испытание упаковки с номером trial.
+	# Первые номера - все сочетания эвристик и ширин из pack_boxes, далее - случайные порядки:
+	# критерий эвристики с шумом и случайная ширина полосы, генератор инициализируется номером.
+	# Если поворот разрешён, случайные испытания так же случайно отключают его, ориентации выбирает skyline_pack.
+	# Один и тот же номер всегда даёт один и тот же результат.
+	area = sum(w * h for w, h in sizes)
+	fixed = len(PACK_HEURISTICS) * len(PACK_WIDTH_FACTORS)
+	if trial < fixed:
+		heuristic = PACK_HEURISTICS[trial // len(PACK_WIDTH_FACTORS)]
+		factor = PACK_WIDTH_FACTORS[trial % len(PACK_WIDTH_FACTORS)]
+		order = pack_order(sizes, heuristic)
+		name = '{0}x{1:.2f}'.format(heuristic, factor)
+	else:
+		rng = random.Random(trial)
+		heuristic = rng.choice(PACK_HEURISTICS)
+		factor = rng.uniform(PACK_WIDTH_FACTORS[0], PACK_WIDTH_FACTORS[-1])
+		key = _PACK_HEURISTIC_KEYS[heuristic]
+		noisy = list(key(w, h) * rng.uniform(0.8, 1.2) for w, h in sizes)
+		order = sorted(range(len(sizes)), key=lambda i: (-noisy[i], i))
+		if alt_sizes is not None and rng.random() < 0.25:
+			alt_sizes = None
+		name = '{0}x{1:.2f}{2}#{3}'.format(heuristic, factor, '' if alt_sizes is None else 'R', trial)
+	width = max(_min_strip_width(sizes, alt_sizes), math.sqrt(area) * factor)
+	positions, rotated, used_w, used_h = skyline_pack(sizes, order, width, alt_sizes=alt_sizes)
+	score = max(used_w, used_h)
+	return PackResult(positions, rotated, used_w, used_h, area / (score * score) if score > 0 else 0.0, name)
+
+
+def pack_trials(
+		sizes: 'Sequence[Tuple[float, float]]', trials: 'Iterable[int]', alt_sizes: 'Optional[Sequence[Tuple[float, float]]]' = None
+) -> 'Optional[PackResult]':
+	# Лучший результат из нескольких испытаний, для запуска в пуле процессов пачками
+	best = None  # type: Optional[PackResult]
+	for trial in trials:
+		result = pack_trial(sizes, trial, alt_sizes=alt_sizes)
+		if best is None or result.get_score() < best.get_score():
+			best = result
+	return best
+
+
+def apply_box_transforms(
+		original: 'numpy.ndarray', target: 'numpy.ndarray', loop_transforms: 'numpy.ndarray', params: 'numpy.ndarray'
+) -> 'numpy.ndarray':
+	# Векторный аналог UVBoxTransform.apply_vec2 сразу для всех лупов меша.
+	# original и target - UV формы (лупы, 2), loop_transforms - номер преобразования для каждого лупа или -1,
+	# params формы (преобразования, 9): ax, ay, aw, ah, bx, by, bw, bh, rotated.
+	# Возвращает копию target, в которой лупы с преобразованием заменены на преобразованные original.
+	result = numpy.array(target, copy=True)
+	loops = numpy.nonzero(loop_transforms >= 0)[0]
+	if len(loops) == 0:
+		return result
+	p = numpy.asarray(params, dtype=numpy.float64)[loop_transforms[loops]]
+	uv = numpy.asarray(original, dtype=numpy.float64)[loops]
+	aw, ah = p[:, 2], p[:, 3]
+	# Вырожденный бокс отображается в центр, как в apply_vec2
+	u = numpy.where(aw != 0, (uv[:, 0] - p[:, 0]) / numpy.where(aw != 0, aw, 1.0), 0.5)
+	v = numpy.where(ah != 0, (uv[:, 1] - p[:, 1]) / numpy.where(ah != 0, ah, 1.0), 0.5)
+	rotated = p[:, 8] != 0
+	u, v = numpy.where(rotated, v, u), numpy.where(rotated, 1.0 - u, v)
+	result[loops, 0] = u * p[:, 6] + p[:, 4]
+	result[loops, 1] = v * p[:, 7] + p[:, 5]
+	return result
+
+
+class BoxTable:
+	# Таблица боксов островов для упаковки: столбцы numpy вместо списка на каждый остров.
+	# pack - X, Y, W, H в пространстве упаковки (X и W поделены на аспект атласа), позиции меняет упаковщик;
+	# source - исходные X, Y, W, H острова в пикселях текстуры материала;
+	# target - X, Y, W, H результата в 0..1;
+	# rotated - повёрнут ли бокс на 90°; attachment - индекс в списке attachments (общий у таблицы и её выборок).
+	__slots__ = ('pack', 'source', 'target', 'rotated', 'attachment', 'attachments')
+	
+	def __init__(self, size: 'int', attachments: 'Optional[List[Any]]' = None):
+		self.pack = numpy.zeros((size, 4), dtype=numpy.float64)
+		self.source = numpy.zeros((size, 4), dtype=numpy.float64)
+		self.target = numpy.zeros((size, 4), dtype=numpy.float64)
+		self.rotated = numpy.zeros(size, dtype=numpy.bool_)
+		self.attachment = numpy.zeros(size, dtype=numpy.int32)
+		self.attachments = attachments if attachments is not None else list()  # type: List[Any]
+	
+	def __len__(self) -> 'int':
+		return len(self.pack)
+	
+	@classmethod
+	def from_rows(
+			cls, pack: 'Sequence[Sequence[float]]', source: 'Sequence[Sequence[float]]',
+			attachment: 'Sequence[int]', attachments: 'List[Any]'
+	) -> 'BoxTable':
+		table = cls(len(attachment), attachments)
+		if len(table) > 0:
+			table.pack[:] = pack
+			table.source[:] = source
+			table.target[:] = pack
+			table.attachment[:] = attachment
+		return table
+	
+	def take(self, rows: 'Sequence[int]') -> 'BoxTable':
+		# Выборка строк в новую таблицу, список attachments общий
+		rows = numpy.asarray(rows, dtype=numpy.int64)
+		table = BoxTable(0, self.attachments)
+		table.pack = self.pack[rows]
+		table.source = self.source[rows]
+		table.target = self.target[rows]
+		table.rotated = self.rotated[rows]
+		table.attachment = self.attachment[rows]
+		return table
+	
+	def get_attachment(self, row: 'int') -> 'Any':
+		return self.attachments[self.attachment[row]]
+	
+	def get_sizes(self) -> 'List[Tuple[float, float]]':
+		# Размеры в пространстве упаковки, в формате atlas_kernels.pack_boxes
+		return list((w, h) for w, h in self.pack[:, 2:4].tolist())
+	
+	def get_alt_sizes(self, aspect: 'float') -> 'List[Tuple[float, float]]':
+		# Размеры повёрнутых на 90° боксов: стороны меняются местами с коррекцией аспекта атласа по X
+		return list((h / aspect, w * aspect) for w, h in self.pack[:, 2:4].tolist())
+	
+	def get_area(self) -> 'float':
+		return float(numpy.sum(self.pack[:, 2] * self.pack[:, 3]))
+	
+	def get_fill(self, score: 'float') -> 'float':
+		# Доля площади квадрата score x score, занятая боксами
+		return self.get_area() / (score * score) if score > 0 else 0.0
+	
+	def to_box_pack_2d(self) -> 'List[List[float]]':
+		# mathutils.geometry.box_pack_2d принимает только список списков и пишет позиции в них же,
+		# поэтому без копирования не обойтись: одна копия столбцов pack на вызов.
+		return self.pack.tolist()
+	
+	def from_box_pack_2d(self, boxes: 'Sequence[Sequence[float]]'):
+		# Обратное to_box_pack_2d: позиции после box_pack_2d в столбцы pack
+		if len(boxes) > 0:
+			self.pack[:] = numpy.asarray(boxes, dtype=numpy.float64)[:, 0:4]
+	
+	def apply_pack_result(self, result: 'PackResult', alt_sizes: 'Optional[Sequence[Tuple[float, float]]]' = None):
+		# Позиции и повороты из результата pack_boxes, затем нормализация в 0..1
+		if len(self) == 0:
+			return
+		self.pack[:, 0:2] = result.positions
+		self.rotated[:] = result.rotated
+		if alt_sizes is not None and numpy.any(self.rotated):
+			self.pack[self.rotated, 2:4] = numpy.asarray(alt_sizes, dtype=numpy.float64)[self.rotated]
+		self.normalize(result.get_score())
+	
+	def normalize(self, score: 'float'):
+		# Преобразование целевых координат в 0..1
+		self.target[:] = self.pack / score if score > 0 else self.pack
+	
+	def get_transform_params(self, source_sizes: 'numpy.ndarray') -> 'numpy.ndarray':
+		# Параметры для apply_box_transforms, формы (боксы, 9).
+		# source_sizes - размеры текстуры материала для каждого бокса, формы (боксы, 2).
+		source_sizes = numpy.asarray(source_sizes, dtype=numpy.float64).reshape(-1, 2)
+		params = numpy.empty((len(self), 9), dtype=numpy.float64)
+		params[:, 0:4] = self.source / numpy.tile(source_sizes, 2)
+		params[:, 4:8] = self.target
+		params[:, 8] = self.rotated
+		return params
+
+
+def to_rgba(pixels: 'numpy.ndarray') -> 'numpy.ndarray':
+	# Пиксели формы (высота, ширина, каналы) с 1 (Y), 2 (Y, A), 3 (RGB) или 4 (RGBA) каналами -> RGBA float32
+	pixels = numpy.asarray(pixels, dtype=numpy.float32)
+	channels = pixels.shape[2]
+	if channels == 4:
+		return pixels
+	rgba = numpy.ones(pixels.shape[0:2] + (4,), dtype=numpy.float32)
+	if channels < 3:
+		rgba[:, :, 0:3] = pixels[:, :, 0:1]
+		if channels == 2:
+			rgba[:, :, 3] = pixels[:, :, 1]
+	else:
+		rgba[:, :, 0:3] = pixels[:, :, 0:3]
+	return rgba
+
+
+# Веса яркости Rec. 709, как у rgb_to_grayscale в Blender Internal
+LUMINANCE_WEIGHTS = (0.2126, 0.7152, 0.0722)
+
+
+def emit_intensity(pixels: 'numpy.ndarray', emit: 'float', factor: 'float' = 0.0, default_value: 'float' = 1.0) -> 'numpy.ndarray':
+	# Серая интенсивность свечения, как её запекает Blender Internal (texture_value_blend, смешивание MIX):
+	# значение слота use_map_emit - яркость текстуры tin, emit' = tin * factor * default_value + (1 - tin * factor) * emit.
+	# Без текстуры factor = 0 и результат просто material.emit. Альфа-канал картинки не учитывается, результат RGBA с альфой 1.
+	rgba = to_rgba(pixels)
+	tin = rgba[:, :, 0:3].dot(numpy.asarray(LUMINANCE_WEIGHTS, dtype=numpy.float32)) * factor
+	value = tin * default_value + (1.0 - tin) * emit
+	result = numpy.ones(rgba.shape, dtype=numpy.float32)
+	result[:, :, 0:3] = value[:, :, None]
+	return result
+
+
+def pixel_rects(targets: 'numpy.ndarray', width: 'int', height: 'int') -> 'numpy.ndarray':
+	# Прямоугольники пикселей атласа (x0, y0, x1, y1, правые границы не включены),
+	# центры которых попадают в целевые боксы (X, Y, W, H в 0..1). Форма (боксы, 4).
+	targets = numpy.asarray(targets, dtype=numpy.float64).reshape(-1, 4)
+	rects = numpy.empty((len(targets), 4), dtype=numpy.int64)
+	rects[:, 0] = numpy.clip(numpy.ceil(targets[:, 0] * width - 0.5), 0, width)
+	rects[:, 1] = numpy.clip(numpy.ceil(targets[:, 1] * height - 0.5), 0, height)
+	rects[:, 2] = numpy.clip(numpy.floor((targets[:, 0] + targets[:, 2]) * width - 0.5) + 1, 0, width)
+	rects[:, 3] = numpy.clip(numpy.floor((targets[:, 1] + targets[:, 3]) * height - 0.5) + 1, 0, height)
+	return rects
+
+
+def boxes_pixels(targets: 'numpy.ndarray', width: 'int', height: 'int') -> 'Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]':
+	# Пиксели атласа, центры которых попадают в целевые боксы (X, Y, W, H в 0..1).
+	# Возвращает номер бокса, X и Y для каждого пикселя, без циклов по боксам.
+	rects = pixel_rects(targets, width, height)
+	x0, y0, x1, y1 = rects[:, 0], rects[:, 1], rects[:, 2], rects[:, 3]
+	nx, ny = numpy.maximum(x1 - x0, 0), numpy.maximum(y1 - y0, 0)
+	counts = nx * ny
+	offsets = numpy.cumsum(counts) - counts
+	boxes = numpy.repeat(numpy.arange(len(targets), dtype=numpy.int64), counts)
+	local = numpy.arange(len(boxes), dtype=numpy.int64) - offsets[boxes]
+	return boxes, x0[boxes] + local % nx[boxes], y0[boxes] + local // nx[boxes]
+
+
+def sample_bilinear(source: 'numpy.ndarray', u: 'numpy.ndarray', v: 'numpy.ndarray') -> 'numpy.ndarray':
+	# Билинейная выборка из картинки формы (высота, ширина, каналы) по UV с повтором (REPEAT), как у ImageTexture
+	height, width = source.shape[0], source.shape[1]
+	fx, fy = u * width - 0.5, v * height - 0.5
+	ix, iy = numpy.floor(fx), numpy.floor(fy)
+	tx, ty = (fx - ix)[:, None], (fy - iy)[:, None]
+	ix0, iy0 = ix.astype(numpy.int64) % width, iy.astype(numpy.int64) % height
+	ix1, iy1 = (ix0 + 1) % width, (iy0 + 1) % height
+	bottom = source[iy0, ix0] * (1 - tx) + source[iy0, ix1] * tx
+	top = source[iy1, ix0] * (1 - tx) + source[iy1, ix1] * tx
+	return bottom * (1 - ty) + top * ty
+
+
+def blit_boxes(atlas: 'numpy.ndarray', source: 'numpy.ndarray', params: 'numpy.ndarray'):
+	# Перенос пикселей островов из исходной картинки в атлас без запекания:
+	# для каждого пикселя атласа внутри целевого бокса ищется точка исходной UV (обратное apply_box_transforms)
+	# и из source берётся билинейная выборка. atlas и source - RGBA формы (высота, ширина, 4), atlas меняется на месте.
+	# params формы (боксы, 9), как у apply_box_transforms.
+	params = numpy.asarray(params, dtype=numpy.float64).reshape(-1, 9)
+	height, width = atlas.shape[0], atlas.shape[1]
+	boxes, px, py = boxes_pixels(params[:, 4:8], width, height)
+	if len(boxes) == 0:
+		return
+	p = params[boxes]
+	# Центр пикселя -> координаты внутри целевого бокса
+	s = ((px + 0.5) / width - p[:, 4]) / numpy.where(p[:, 6] != 0, p[:, 6], 1.0)
+	t = ((py + 0.5) / height - p[:, 5]) / numpy.where(p[:, 7] != 0, p[:, 7], 1.0)
+	# Поворот вперёд (u, v) -> (v, 1 - u), обратно (s, t) -> (1 - t, s)
+	rotated = p[:, 8] != 0
+	u, v = numpy.where(rotated, 1.0 - t, s), numpy.where(rotated, s, t)
+	atlas[py, px] = sample_bilinear(source, p[:, 0] + u * p[:, 2], p[:, 1] + v * p[:, 3])
+
+
+def tile_key(*parts: 'Any') -> 'str':
+	# Ключ кеша тайлов: SHA-1 от частей, массивы numpy - по содержимому, остальное - по repr
+	digest = hashlib.sha1()
+	for part in parts:
+		if isinstance(part, numpy.ndarray):
+			digest.update(str(part.dtype).encode('utf-8'))
+			digest.update(numpy.ascontiguousarray(part).tobytes())
+		else:
+			digest.update(repr(part).encode('utf-8'))
+		digest.update(b'\0')
+	return digest.hexdigest()
+
+
+class TileCache:
+	# Кеш запечённых тайлов островов на диске: один файл .npy на ключ (tile_key).
+	# Запись через временный файл, что бы оборванный запуск не оставлял битых тайлов.
+	# Размер каталога ограничивает prune(), удаляя давно не использованные тайлы; сам каталог можно удалить в любой момент.
+	__slots__ = ('directory', 'hits', 'misses')
+	
+	def __init__(self, directory: 'str'):
+		self.directory = directory
+		self.hits = 0
+		self.misses = 0
+		os.makedirs(directory, exist_ok=True)
+	
+	def get_path(self, key: 'str') -> 'str':
+		return os.path.join(self.directory, key + '.npy')
+	
+	def get(self, key: 'str', shape: 'Optional[Tuple[int, ...]]' = None) -> 'Optional[numpy.ndarray]':
+		# Тайл по ключу или None, если его нет, он не читается или другой формы
+		tile = None
+		try:
+			tile = numpy.load(self.get_path(key))
+		except (IOError, OSError, ValueError):
+			pass
+		if tile is not None and shape is not None and tile.shape != tuple(shape):
+			tile = None
+		if tile is None:
+			self.misses += 1
+		else:
+			self.hits += 1
+			try:
+				os.utime(self.get_path(key))  # Время изменения - время последнего использования, для prune()
+			except OSError:
+				pass
+		return tile
+	
+	def put(self, key: 'str', tile: 'numpy.ndarray'):
+		path = self.get_path(key)
+		temp_path = path + '.tmp'
+		with open(temp_path, 'wb') as temp_file:
+			numpy.save(temp_file, tile)
+		os.replace(temp_path, path)
+	
+	def prune(self, max_bytes: 'int') -> 'int':
+		# Удаляет тайлы (и недописанные .tmp), начиная с давно не использованных, пока каталог больше max_bytes.
+		# Возвращает число удалённых файлов.
+		entries = list()  # type: List[Tuple[float, int, str]]
+		for name in os.listdir(self.directory):
+			path = os.path.join(self.directory, name)
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue
+			entries.append((stat.st_mtime, stat.st_size, path))
+		total = sum(entry[1] for entry in entries)
+		removed = 0
+		for _, file_size, path in sorted(entries):
+			if total <= max_bytes:
+				break
+			try:
+				os.remove(path)
+			except OSError:
+				continue
+			total -= file_size
+			removed += 1
+		return removed
+
+
+def boxes_mask(targets: 'numpy.ndarray', width: 'int', height: 'int') -> 'numpy.ndarray':
+	# Маска покрытия атласа боксами (X, Y, W, H в 0..1), формы (высота, ширина)
+	mask = numpy.zeros((height, width), dtype=numpy.bool_)
+	for x0, y0, x1, y1 in pixel_rects(targets, width, height).tolist():
+		mask[y0:y1, x0:x1] = True
+	return mask
+
+
+# Смещения соседей пикселя (dx, dy), 8-связность
+_DILATE_NEIGHBOURS = ((-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+
+def dilate(pixels: 'numpy.ndarray', mask: 'numpy.ndarray', distance: 'int') -> 'numpy.ndarray':
+	# Расширение краёв (edge padding): пиксели вне mask на расстоянии до distance (по Чебышёву) от покрытых
+	# получают среднее уже заполненных соседей. На каждом шаге обрабатывается только фронт - последнее заполненное кольцо,
+	# поэтому цена шага пропорциональна периметру, а не площади картинки.
+	# pixels формы (высота, ширина, каналы), возвращается новый массив.
+	height, width = mask.shape
+	channels = pixels.shape[2]
+	colors = numpy.array(pixels, dtype=numpy.float32).reshape(-1, channels)
+	filled = numpy.array(mask, dtype=numpy.bool_).ravel()
+	xs = numpy.arange(height * width, dtype=numpy.int64) % width
+	
+	def neighbours(indices: 'numpy.ndarray', dx: 'int', dy: 'int') -> 'Tuple[numpy.ndarray, numpy.ndarray]':
+		# Индексы соседей и маска тех, что не выходят за картинку
+		x = xs[indices] + dx
+		nb = indices + dx + dy * width
+		valid = (x >= 0) & (x < width) & (nb >= 0) & (nb < height * width)
+		return numpy.where(valid, nb, 0), valid
+	
+	frontier = numpy.nonzero(filled)[0]
+	for _ in range(distance):
+		candidates = list()
+		for dx, dy in _DILATE_NEIGHBOURS:
+			nb, valid = neighbours(frontier, dx, dy)
+			candidates.append(nb[valid & ~filled[nb]])
+		frontier = numpy.unique(numpy.concatenate(candidates))
+		if len(frontier) == 0:
+			break
+		total = numpy.zeros((len(frontier), channels), dtype=numpy.float32)
+		count = numpy.zeros(len(frontier), dtype=numpy.float32)
+		for dx, dy in _DILATE_NEIGHBOURS:
+			nb, valid = neighbours(frontier, dx, dy)
+			use = valid & filled[nb]
+			total[use] += colors[nb[use]]
+			count[use] += 1
+		colors[frontier] = total / count[:, None]
+		filled[frontier] = True
+	return colors.reshape(height, width, channels)
@@ -0,0 +1,54 @@
+# Kawashirov's Scripts (c) 2019 by Sergey V. Kawashirov
+#
+# Kawashirov's Scripts is licensed under a
+# Creative Commons Attribution-NonCommercial-ShareAlike 3.0 Unported License.
+#
+# You should have received a copy of the license along with this
+# work.  If not, see <http://creativecommons.org/licenses/by-nc-sa/3.0/>.
+#
+#
+
+# Скрипт фонового процесса запекания, запускается KawaMeshCombiner.atlas_bake_parallel так:
+# blender -b <временный .blend> --python-exit-code 1 --python bake_worker.py -- <json>
+# Запекает одну текстуру атласа и сохраняет её в PNG. Не импортирует kawa_scripts, только bpy.
+
+import bpy
+import json
+import sys
+
+
+def main(argv):
+	args = json.loads(argv[argv.index('--') + 1])
+	scene = bpy.context.scene
+	image = bpy.data.images[args['image']]
+	
+	for obj in scene.objects:
+		obj.select = False
+	polys_assigns = 0
+	for name in args['objects']:
+		obj = bpy.data.objects[name]
+		obj.select = True
+		obj.hide = False
+		obj.hide_render = False
+		for layer in obj.data.uv_textures:
+			layer.active = layer.name == args['target_uv']
+			layer.active_render = layer.name == args['original_uv']
+			layer.active_clone = False
+			if layer.active:
+				for data in layer.data:
+					data.image = image
+					polys_assigns += 1
+	
+	for key, value in args['settings'].items():
+		setattr(scene.render, key, value)
+	print("Baking Texture='%s' from %d polygons..." % (image.name, polys_assigns))
+	result = bpy.ops.object.bake_image()
+	if 'FINISHED' not in result:
+		raise RuntimeError('Operator is not FINISHED: ', 'bpy.ops.object.bake_image', result)
+	
+	image.filepath_raw = args['output']
+	image.file_format = 'PNG'
+	image.save()
+
+
+main(sys.argv)
@@ -9,11 +9,22 @@
 #
 
 import bpy
+import bmesh
 import mathutils
+import hashlib
+import numpy
 import logging
+import os
+import multiprocessing
+import concurrent.futures
+import contextlib
+import sys
 
 import typing
 
+from .atlas_kernels import polygons_loop_indices
+from . import pool_main
+
 if typing.TYPE_CHECKING:
 	from typing import *
 	
@@ -45,6 +56,71 @@ def uv_area(poly: bpy.types.MeshPolygon, uv_layer_data: 'Sequence[bpy.types.Mesh
 	return poly2_area2(tuple(uv_layer_data[loop].uv for loop in poly.loop_indices))
 
 
+def foreach_get_array(collection: 'bpy.types.bpy_prop_collection', attr: 'str', dtype, width: 'int' = 1) -> 'numpy.ndarray':
+	# Чтение атрибута у всех элементов коллекции одним вызовом foreach_get.
+	# dtype должен совпадать с типом свойства: numpy.float32 для float, numpy.int32 для int и т.д.
+	array = numpy.empty(len(collection) * width, dtype=dtype)
+	collection.foreach_get(attr, array)
+	return array.reshape(-1, width) if width != 1 else array
+
+
+def image_pixels_get(image: 'bpy.types.Image') -> 'numpy.ndarray':
+	# Пиксели картинки формы (высота, ширина, каналы), float32, строки снизу вверх как в UV.
+	# У Image.pixels нет foreach_get в старых версиях Blender (2.79), тогда чтение через срез.
+	width, height, channels = image.size[0], image.size[1], image.channels
+	pixels = image.pixels
+	if hasattr(pixels, 'foreach_get'):
+		array = numpy.empty(width * height * channels, dtype=numpy.float32)
+		pixels.foreach_get(array)
+	else:
+		array = numpy.array(pixels[:], dtype=numpy.float32)
+	return array.reshape(height, width, channels)
+
+
+def image_pixels_set(image: 'bpy.types.Image', array: 'numpy.ndarray'):
+	# Запись пикселей картинки одним вызовом, форма array должна совпадать с image_pixels_get
+	array = numpy.asarray(array, dtype=numpy.float32).ravel()
+	pixels = image.pixels
+	if hasattr(pixels, 'foreach_set'):
+		pixels.foreach_set(array)
+	else:
+		pixels[:] = array.tolist()
+	image.update()
+
+
+def image_content_hash(image: 'bpy.types.Image') -> 'str':
+	# SHA-1 содержимого картинки: файла на диске, если картинка из не изменённого файла, иначе пикселей
+	digest = hashlib.sha1()
+	path = bpy.path.abspath(image.filepath) if image.source == 'FILE' and image.filepath else ''
+	if image.packed_file is None and not image.is_dirty and os.path.isfile(path):
+		with open(path, 'rb') as image_file:
+			for chunk in iter(lambda: image_file.read(1 << 20), b''):
+				digest.update(chunk)
+	else:
+		digest.update(image_pixels_get(image).tobytes())
+	return digest.hexdigest()
+
+
+def uv_areas(loop_uvs: 'numpy.ndarray', loop_starts: 'numpy.ndarray', loop_totals: 'numpy.ndarray') -> 'numpy.ndarray':
+	# Площади UV сразу всех полигонов меша, по формуле шнурования (без учёта самопересечений)
+	# loop_uvs формы (лупы, 2), loop_starts и loop_totals как у Mesh.polygons
+	if len(loop_starts) == 0:
+		return numpy.zeros(0, dtype=numpy.float64)
+	loop_totals = numpy.asarray(loop_totals, dtype=numpy.int64)
+	loop_indices, offsets = polygons_loop_indices(loop_starts, loop_totals)
+	uvs = numpy.asarray(loop_uvs, dtype=numpy.float64)[loop_indices]
+	# Следующий луп в том же полигоне, у последнего - первый
+	next_indices = numpy.arange(1, len(uvs) + 1, dtype=numpy.int64)
+	next_indices[offsets + loop_totals - 1] = offsets
+	cross = uvs[:, 0] * uvs[next_indices, 1] - uvs[next_indices, 0] * uvs[:, 1]
+	return numpy.abs(numpy.add.reduceat(cross, offsets)) / 2
+
+
+def uv_areas_order(loop_uvs: 'numpy.ndarray', loop_starts: 'numpy.ndarray', loop_totals: 'numpy.ndarray') -> 'numpy.ndarray':
+	# Индексы полигонов от большей площади UV к меньшей, при равенстве сохраняется исходный порядок
+	return numpy.argsort(-uv_areas(loop_uvs, loop_starts, loop_totals), kind='mergesort')
+
+
 def is_none_or_bool(value: 'Optional[bool]') -> 'bool':
 	return value is None or isinstance(value, bool)
 
@@ -94,6 +170,89 @@ def ensure_deselect_all():
 	ensure_op_finished(bpy.ops.object.select_all(action='DESELECT'), name="bpy.ops.object.select_all(action='DESELECT')")
 
 
+class SelectionManager:
+	# Выделение без bpy.ops.object.select_all(action='DESELECT'), который обходит все объекты сцены.
+	# begin() запоминает выделение и активный объект пользователя и снимает выделение один раз,
+	# дальше переключаются только объекты, выделенные через select() или track(), restore() возвращает всё как было.
+	__slots__ = ('scene', 'selected', 'user_selected', 'user_active')
+	
+	def __init__(self):
+		self.scene = None  # type: Optional[bpy.types.Scene]
+		self.selected = set()  # type: Set[bpy.types.Object]
+		self.user_selected = list()  # type: List[bpy.types.Object]
+		self.user_active = None  # type: Optional[bpy.types.Object]
+	
+	def begin(self):
+		self.scene = bpy.context.scene
+		self.user_selected = list(bpy.context.selected_objects)
+		self.user_active = self.scene.objects.active
+		for obj in self.user_selected:
+			obj.select = False
+		self.selected.clear()
+	
+	def select(self, *objects: 'bpy.types.Object'):
+		for obj in objects:
+			obj.select = True
+			self.selected.add(obj)
+	
+	def track(self, objects: 'Iterable[bpy.types.Object]'):
+		# Объекты, выделенные операторами (duplicate, separate и т.п.), а не через select()
+		self.selected.update(objects)
+	
+	def set_active(self, obj: 'Optional[bpy.types.Object]'):
+		self.scene.objects.active = obj
+	
+	def deselect_all(self):
+		for obj in self.selected:
+			try:
+				obj.select = False
+			except ReferenceError:
+				pass  # Объект уже удалён, например присоединён через join
+		self.selected.clear()
+	
+	def restore(self):
+		if self.scene is None:
+			return
+		self.deselect_all()
+		for obj in self.user_selected:
+			try:
+				obj.select = True
+			except ReferenceError:
+				pass
+		try:
+			self.scene.objects.active = self.user_active
+		except ReferenceError:
+			self.scene.objects.active = None
+		self.user_selected.clear()
+		self.user_active = None
+		self.scene = None
+
+
+@contextlib.contextmanager
+def make_process_pool(workers: 'int') -> 'Iterator[concurrent.futures.ProcessPoolExecutor]':
+	# Пул процессов для bpy-free задач atlas_kernels, использовать как with make_process_pool(n) as pool.
+	# Процессы всегда запускаются через spawn: fork скопировал бы весь процесс Blender.
+	# Внутри Blender sys.executable указывает на сам blender, а не на python, по этому интерпретатор указывается явно.
+	# spawn в дочернем процессе заново выполняет __main__ родителя: скрипт --python (целиком, если в нём нет
+	# if __name__ == '__main__') или текстовый блок, у которого и файла-то нет. По этому на время жизни пула
+	# __main__ подменяется пустым модулем pool_main, и дочерние процессы выполняют его.
+	if multiprocessing.get_start_method(allow_none=True) != 'spawn':
+		multiprocessing.set_start_method('spawn', force=True)
+	python = getattr(bpy.app, 'binary_path_python', None)
+	if python:
+		multiprocessing.set_executable(python)
+	main_module = sys.modules.get('__main__')
+	sys.modules['__main__'] = pool_main
+	try:
+		with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+			yield pool
+	finally:
+		if main_module is not None:
+			sys.modules['__main__'] = main_module
+		else:
+			del sys.modules['__main__']
+
+
 def any_not_none(*args):
 	# Первый не-None, или None
 	for v in args:
@@ -109,22 +268,135 @@ def get_mesh_safe(obj: 'bpy.types.Object') -> 'bpy.types.Mesh':
 	return mesh
 
 
+def copy_uv_layer(mesh: 'bpy.types.Mesh', source_name: 'str', target_name: 'str') -> 'bpy.types.MeshTexturePolyLayer':
+	# Замена bpy.ops.mesh.uv_texture_add с переименованием: новый слой через data API,
+	# UV копируются из исходного слоя одним foreach_get/foreach_set, без оператора и смены контекста.
+	# Исходный слой делается активным, т.к. uv_textures.new дублирует активный слой (вместе с картинками полигонов).
+	mesh.uv_textures[source_name].active = True
+	layer = mesh.uv_textures.new(target_name)
+	if layer is None:
+		raise RuntimeError("Can not create UV-Layer!", mesh.name, target_name, len(mesh.uv_textures))
+	# Ссылки на слои после new() могут быть уже невалидны, дальше только по именам
+	target_name = layer.name
+	uvs = foreach_get_array(mesh.uv_layers[source_name].data, 'uv', numpy.float32, 2)
+	mesh.uv_layers[target_name].data.foreach_set('uv', uvs.ravel())
+	return mesh.uv_textures[target_name]
+
+
+# Типы слоёв BMLayerAccess, которые переносит copy_bmesh_layers
+BMESH_LAYER_TYPES = (
+	'float', 'int', 'string', 'color', 'uv', 'tex', 'shape', 'deform', 'skin', 'bevel_weight', 'crease', 'freestyle', 'paint_mask'
+)
+# Свойства ShapeKey, которые переносит copy_shape_keys. slider_min/slider_max раньше value, т.к. они его ограничивают.
+SHAPE_KEY_PROPERTIES = ('interpolation', 'mute', 'slider_min', 'slider_max', 'value', 'vertex_group')
+
+
+def copy_bmesh_layers(source: 'bmesh.types.BMesh', target: 'bmesh.types.BMesh'):
+	# Создаёт в target те же слои данных, что и в source, в том же порядке.
+	# Нужно для bmesh.ops.duplicate(dest=target): данные копируются только в совпадающие слои.
+	for domain in ('verts', 'edges', 'faces', 'loops'):
+		source_layers = getattr(source, domain).layers
+		target_layers = getattr(target, domain).layers
+		for layer_type in BMESH_LAYER_TYPES:
+			source_collection = getattr(source_layers, layer_type, None)
+			if source_collection is None:
+				continue
+			target_collection = getattr(target_layers, layer_type)
+			for name in source_collection.keys():
+				if target_collection.get(name) is None:
+					target_collection.new(name)
+
+
+def get_custom_normals(mesh: 'bpy.types.Mesh') -> 'Optional[numpy.ndarray]':
+	# Пользовательские нормали лупов формы (лупы, 3) или None, если их нет
+	if not mesh.has_custom_normals:
+		return None
+	mesh.calc_normals_split()
+	try:
+		return foreach_get_array(mesh.loops, 'normal', numpy.float32, 3)
+	finally:
+		mesh.free_normals_split()
+
+
+def set_custom_normals(mesh: 'bpy.types.Mesh', normals: 'numpy.ndarray'):
+	# Запись пользовательских нормалей лупов, форма (лупы, 3). Без use_auto_smooth Blender их не использует.
+	mesh.use_auto_smooth = True
+	mesh.normals_split_custom_set(normals.reshape(-1, 3).tolist())
+
+
+def copy_shape_keys(mesh: 'bpy.types.Mesh', bm: 'bmesh.types.BMesh', obj: 'bpy.types.Object'):
+	# Шейпкеи mesh для объекта obj, чья меша только что записана из bm (bm получен из mesh, у него те же слои shape).
+	# Координаты берутся из слоёв shape в bm, т.к. вершины bm и новой меши совпадают, а с mesh - нет.
+	shape_layers = bm.verts.layers.shape
+	key_blocks = mesh.shape_keys.key_blocks
+	for key_block in key_blocks:
+		new_block = obj.shape_key_add(name=key_block.name, from_mix=False)
+		layer = shape_layers.get(key_block.name)
+		if layer is not None:
+			new_block.data.foreach_set('co', list(c for vert in bm.verts for c in vert[layer]))
+		for prop in SHAPE_KEY_PROPERTIES:
+			setattr(new_block, prop, getattr(key_block, prop))
+	new_key_blocks = get_mesh_safe(obj).shape_keys.key_blocks
+	for key_block in key_blocks:
+		new_key_blocks[key_block.name].relative_key = new_key_blocks[key_block.relative_key.name]
+	get_mesh_safe(obj).shape_keys.use_relative = mesh.shape_keys.use_relative
+
+
+def weld_boundary_verts(mesh: 'bpy.types.Mesh', distance: 'float') -> 'int':
+	# Замена remove_doubles по выделенным non-manifold рёбрам в режиме редактирования:
+	# совпадающие вершины ищутся только на границах (швах от разрезания по материалам) через KDTree
+	# и сливаются одним bmesh.ops.weld_verts, без операторов и смены режима.
+	bm = bmesh.new()
+	try:
+		bm.from_mesh(mesh)
+		boundary = list(vert for vert in bm.verts if any(edge.is_boundary for edge in vert.link_edges))
+		if len(boundary) < 2:
+			return 0
+		kd = mathutils.kdtree.KDTree(len(boundary))
+		for i, vert in enumerate(boundary):
+			kd.insert(vert.co, i)
+		kd.balance()
+		# Вершина сливается в первую (по порядку) вершину в радиусе, которая сама никуда не слита
+		merged = set()  # type: Set[int]
+		targetmap = dict()  # type: Dict[bmesh.types.BMVert, bmesh.types.BMVert]
+		for i, vert in enumerate(boundary):
+			if i in merged:
+				continue
+			for _, j, _ in kd.find_range(vert.co, distance):
+				if j > i and j not in merged:
+					merged.add(j)
+					targetmap[boundary[j]] = vert
+		if len(targetmap) > 0:
+			bmesh.ops.weld_verts(bm, targetmap=targetmap)
+			bm.to_mesh(mesh)
+			mesh.update()
+		return len(targetmap)
+	finally:
+		bm.free()
+
+
+def remove_uv_layers(
+		mesh: 'bpy.types.Mesh',
+		condition: 'Union[Callable[[str, bpy.types.MeshTexturePolyLayer], bool], Container[str]]',
+		func_on_delete: 'Callable[[str, bpy.types.MeshTexturePolyLayer], None]' = None
+) -> 'int':
+	# Пакетное удаление UV слоёв: condition - предикат (имя, слой) или набор имён.
+	# После remove() все MeshTexturePolyLayer взятые из uv_textures становятся сломанными и крешат скрипт,
+	# по этому сначала за один проход собираются имена, а потом каждый слой берётся по имени прямо перед удалением.
+	if callable(condition):
+		to_delete_names = list(name for name, uv_layer in mesh.uv_textures.items() if condition(name, uv_layer))
+	else:
+		to_delete_names = list(name for name in mesh.uv_textures.keys() if name in condition)
+	for name in to_delete_names:
+		to_delete = mesh.uv_textures[name]
+		if func_on_delete is not None: func_on_delete(name, to_delete)
+		mesh.uv_textures.remove(to_delete)
+	return len(to_delete_names)
+
+
 def remove_uv_layer_by_condition(
 		mesh: 'bpy.types.Mesh',
 		func_should_delete: 'Callable[str, bpy.types.MeshTexturePolyLayer, bool]',
 		func_on_delete: 'Callable[str, bpy.types.MeshTexturePolyLayer, None]'
 ):
-	while True:
-		# Удаление таким нелепым образом, потому что после вызова remove()
-		# все MeshTexturePolyLayer взятые из uv_textures становтся сломанными и крешат скрипт
-		# По этому, после удаления обход начинается заново, до тех пор, пока не кончатся объекты к удалению
-		# Блендер сосёт жопу
-		to_delete_name = None
-		to_delete = None
-		for uv_layer_name, uv_layer in mesh.uv_textures.items():
-			if func_should_delete(uv_layer_name, uv_layer):
-				to_delete_name, to_delete = uv_layer_name, uv_layer
-				break
-		if to_delete is None: return
-		if func_on_delete is not None: func_on_delete(to_delete_name, to_delete)
-		mesh.uv_textures.remove(to_delete)
+	remove_uv_layers(mesh, func_should_delete, func_on_delete)
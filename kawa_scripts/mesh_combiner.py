@@ -9,11 +9,21 @@
 #
 
 import bmesh
+import concurrent.futures
+import hashlib
 import logging
+import json
+import math
+import numpy
+import os
+import shutil
+import subprocess
+import tempfile
 import typing
 import time
 
 from .commons import *
+from .atlas_kernels import *
 
 if typing.TYPE_CHECKING:
 	from typing import *
@@ -23,8 +33,7 @@ if typing.TYPE_CHECKING:
 	SetupRaw = Dict[str, Any]
 	SizeInt = Tuple[int, int]
 	SizeFloat = Tuple[float, float]
-	MathUtilsBox = List[Union[float, 'AttachmentPerMaterial']]
-	MathUtilsBoxes = List[MathUtilsBox]
+	Box = Tuple[float, float, float, float]
 	IslandsBuilders = Dict[bpy.types.Material, 'IslandsBuilder']
 	OriginalObjectSetups = Dict[bpy.types.Object, 'OriginalObjectSetup']
 	OriginalMaterialSetups = Dict[bpy.types.Material, 'OriginalMaterialSetup']
@@ -78,7 +87,8 @@ class OriginalMaterialSetup:
 	__slots__ = (
 		'parent', 'material',
 		'original_size', '_detected_size',
-		'atlas_ignore', 'atlas_material_name', 'atlas_single_island', 'atlas_scale', 'atlas_epsilon',
+		'atlas_ignore', 'atlas_material_name', 'atlas_single_island', 'atlas_islands_mode', 'atlas_scale', 'atlas_epsilon',
+		'atlas_page', '_bake_hash', 'bake_aa',
 		'lm_ignore', 'lm_scale',
 	)
 	
@@ -93,8 +103,14 @@ class OriginalMaterialSetup:
 		self.atlas_ignore = None  # type: Optional[bool]
 		self.atlas_material_name = None  # type: Optional[str]
 		self.atlas_single_island = None  # type: Optional[bool]
+		self.atlas_islands_mode = None  # type: Optional[str]
 		self.atlas_scale = 1.0  # type: float
 		self.atlas_epsilon = None  # type: Optional[float]
+		# Страница атласа, назначается при упаковке (KawaMeshCombiner.atlas_split_pages)
+		self.atlas_page = 0  # type: int
+		# Если None, хеш ещё не считался
+		self._bake_hash = None  # type: Optional[str]
+		self.bake_aa = None  # type: Optional[str]
 		
 		self.lm_ignore = None  # type: Optional[bool]
 		self.lm_scale = 1.0  # type: float
@@ -121,9 +137,16 @@ class OriginalMaterialSetup:
 			omat_setup.atlas_single_island = parent.validate_bool(
 				raw_setup.get(KawaMeshCombiner.L_ATLAS_SINGLE_ISLAND), prefix + KawaMeshCombiner.L_ATLAS_SINGLE_ISLAND
 			)
+			omat_setup.atlas_islands_mode = parent.validate_choice(
+				raw_setup.get(KawaMeshCombiner.L_ATLAS_ISLANDS_MODE), KawaMeshCombiner.ATLAS_ISLANDS_MODES,
+				prefix + KawaMeshCombiner.L_ATLAS_ISLANDS_MODE
+			)
 			omat_setup.atlas_epsilon = parent.validate_int_positive_or_zero(
 				raw_setup.get(KawaMeshCombiner.L_ATLAS_EPSILON), prefix + KawaMeshCombiner.L_ATLAS_EPSILON
 			)
+			omat_setup.bake_aa = parent.validate_choice(
+				raw_setup.get(KawaMeshCombiner.L_BAKE_AA), KawaMeshCombiner.BAKE_AA_MODES, prefix + KawaMeshCombiner.L_BAKE_AA
+			)
 			atlas_scale = parent.validate_float(raw_setup.get(cls.L_ATLAS_SCALE), prefix + cls.L_ATLAS_SCALE)
 			omat_setup.atlas_scale = any_not_none(atlas_scale, omat_setup.atlas_scale)
 			
@@ -152,6 +175,62 @@ class OriginalMaterialSetup:
 					tex_count += 1
 		return (float(tex_sz_x) / tex_count, float(tex_sz_y) / tex_count) if tex_count > 0 else None
 	
+	def find_tex_slot(self, tex_type: 'str') -> 'Optional[bpy.types.MaterialTextureSlot]':
+		# Первый включенный слот с картинкой, влияющий на данный тип текстуры атласа (как в find_tex_size)
+		if self.material.texture_slots is not None:
+			for slot in self.material.texture_slots:
+				if slot is None or not slot.use: continue
+				if not isinstance(slot.texture, bpy.types.ImageTexture) or slot.texture.image is None: continue
+				if tex_type == 'TEXTURE' and slot.use_map_color_diffuse:
+					return slot
+				if tex_type == 'EMIT' and slot.use_map_emit:
+					return slot
+		return None
+	
+	def find_tex_image(self, tex_type: 'str') -> 'Optional[bpy.types.Image]':
+		slot = self.find_tex_slot(tex_type)
+		return slot.texture.image if slot is not None else None
+	
+	def get_blit_source(self, tex_type: 'str') -> 'numpy.ndarray':
+		# RGBA пиксели для atlas_kernels.blit_boxes: то же, что дал бы рендер-бейк этого типа.
+		# TEXTURE - картинка слота или, если её нет, цвет материала 1x1.
+		# EMIT - серая интенсивность свечения (см. emit_intensity) и с картинкой, и без неё.
+		slot = self.find_tex_slot(tex_type)
+		if tex_type == 'EMIT':
+			if slot is None:
+				return emit_intensity(numpy.zeros((1, 1, 4), dtype=numpy.float32), self.material.emit)
+			if slot.blend_type != 'MIX':
+				log.warning("Material '%s': emit texture slot blend type %s is blitted as MIX.", self.material.name, slot.blend_type)
+			pixels = image_pixels_get(slot.texture.image)
+			return emit_intensity(pixels, self.material.emit, slot.emit_factor, slot.default_value)
+		if slot is not None:
+			return to_rgba(image_pixels_get(slot.texture.image))
+		color = numpy.ones((1, 1, 4), dtype=numpy.float32)
+		color[0, 0, 0:3] = tuple(self.material.diffuse_color)
+		return color
+	
+	def get_bake_hash(self) -> 'str':
+		# Хеш всего, что в материале влияет на запекание: цвета материала, настройки слотов и содержимое картинок.
+		# Считается один раз за запуск, для ключей кеша тайлов.
+		if self._bake_hash is not None:
+			return self._bake_hash
+		mat = self.material
+		parts = [
+			tuple(mat.diffuse_color), mat.diffuse_intensity, mat.emit, mat.alpha, mat.use_transparency, mat.use_shadeless,
+			tuple(mat.specular_color), mat.specular_intensity,
+		]
+		if mat.texture_slots is not None:
+			for slot in mat.texture_slots:
+				if slot is None or not slot.use: continue
+				parts.append((
+					slot.blend_type, slot.use_map_color_diffuse, slot.use_map_alpha, slot.use_map_emit, slot.use_map_normal,
+					slot.diffuse_color_factor, slot.alpha_factor, slot.emit_factor, slot.normal_factor, slot.default_value,
+				))
+				if isinstance(slot.texture, bpy.types.ImageTexture) and slot.texture.image is not None:
+					parts.append(image_content_hash(slot.texture.image))
+		self._bake_hash = tile_key(*parts)
+		return self._bake_hash
+	
 	def get_atlas_material_name(self) -> 'str':
 		return any_not_none(self.atlas_material_name, self.parent.atlas_material_name)
 	
@@ -159,7 +238,7 @@ class OriginalMaterialSetup:
 		atlas_material_name = self.get_atlas_material_name()
 		if atlas_material_name is None:
 			raise ConfigurationError('atlas_material_name is not set!', self.material, self.atlas_material_name, self.parent.atlas_material_name)
-		return self.parent.get_atlas_material_setup(atlas_material_name)
+		return self.parent.get_atlas_material_setup(atlas_material_name, self.atlas_page)
 	
 	def get_atlas_ignore(self) -> 'bool':
 		atlas_ignore = any_not_none(self.atlas_ignore, self.parent.atlas_ignore)
@@ -190,6 +269,14 @@ class OriginalMaterialSetup:
 			raise ConfigurationError('atlas_single_island is not set!', self.material, self.atlas_single_island, self.parent.atlas_single_island)
 		return atlas_single_island
 	
+	def get_atlas_islands_mode(self) -> 'str':
+		if self.get_atlas_ignore():
+			raise RuntimeError('Can not get atlas_islands_mode, because atlas_ignore is set to True!', self.material)
+		atlas_islands_mode = any_not_none(self.atlas_islands_mode, self.parent.atlas_islands_mode)
+		if atlas_islands_mode is None:
+			raise ConfigurationError('atlas_islands_mode is not set!', self.material, self.atlas_islands_mode, self.parent.atlas_islands_mode)
+		return atlas_islands_mode
+	
 	def get_atlas_epsilon(self) -> 'float':
 		if self.get_atlas_ignore():
 			raise RuntimeError('Can not get atlas_epsilon, because atlas_ignore is set to True!', self.material)
@@ -198,6 +285,13 @@ class OriginalMaterialSetup:
 			raise ConfigurationError('atlas_epsilon is not set!', self.material, self.atlas_epsilon, self.parent.atlas_epsilon)
 		return epsilon
 	
+	def get_bake_aa(self) -> 'str':
+		if self.get_atlas_ignore():
+			raise RuntimeError('Can not get bake_aa, because atlas_ignore is set to True!', self.material)
+		if self.parent.fast_mode:
+			return '5'
+		return any_not_none(self.bake_aa, self.parent.bake_aa, '16')
+	
 	def get_lm_ignore(self) -> 'bool':
 		lm_ignore = any_not_none(self.lm_ignore, self.parent.lm_ignore)
 		if lm_ignore is None:
@@ -209,7 +303,9 @@ class OriginalMaterialSetup:
 		if not self.get_atlas_ignore():
 			self.get_original_size()
 			self.get_atlas_single_island()
+			self.get_atlas_islands_mode()
 			self.get_atlas_epsilon()
+			self.get_bake_aa()
 		self.get_lm_ignore()
 
 
@@ -223,7 +319,7 @@ class AtlasTextureSetup:
 	
 	__slots__ = (
 		'parent', 'texture', 'image',
-		'type', 'size'
+		'type', 'size', 'page', 'bake_margin',
 	)
 	
 	def __init__(self, parent: 'KawaMeshCombiner', _type: 'str', setup: 'Optional[SetupRaw]'):
@@ -240,12 +336,23 @@ class AtlasTextureSetup:
 		prefix = parent.L_ATLAS_TEXTURES + '.' + _type + '.'
 		self.type = _type
 		self.size = parent.validate_size_int(setup.get(self.L_SIZE), prefix + self.L_SIZE)
+		self.page = 0  # type: int
+		self.bake_margin = None  # type: Optional[int] # Задаёт atlas_bake_page при bake_dilation > 0
 	
 	def __str__(self) -> str: return common_str_slots(self, self.__slots__, ('parent',))
 	
 	def __repr__(self) -> str: return common_str_slots(self, self.__slots__, ('parent',))
 	
+	def for_page(self, page: 'int') -> 'AtlasTextureSetup':
+		# Копия настроек для дополнительной страницы атласа, со своими текстурой и картинкой
+		page_setup = type(self)(self.parent, self.type, None)
+		page_setup.size = self.size
+		page_setup.page = page
+		return page_setup
+	
 	def get_texture_name(self):
+		if self.page > 0:
+			return '{0}-P{1}-{2}'.format(self.parent.atlas_texture_prefix, self.page, self.type)
 		return self.parent.atlas_texture_prefix + '-' + self.type
 	
 	def get_size(self) -> 'SizeInt':
@@ -331,7 +438,7 @@ class AtlasMaterialSetup:
 	
 	__slots__ = (
 		'parent', 'name', 'material',
-		'order', 'use_transparency', 'alpha',
+		'order', 'use_transparency', 'alpha', 'page',
 	)
 	
 	def __init__(self, parent: 'KawaMeshCombiner', name: 'str', setup: 'Optional[SetupRaw]'):
@@ -345,11 +452,25 @@ class AtlasMaterialSetup:
 		self.order = parent.validate_float(setup.get(self.L_ORDER), prefix + self.L_ORDER)
 		self.use_transparency = parent.validate_bool(setup.get(self.L_USE_TRANSPARENCY), prefix + self.L_USE_TRANSPARENCY)
 		self.alpha = parent.validate_bool(setup.get(self.L_ALPHA), prefix + self.L_ALPHA)
+		self.page = 0  # type: int
 	
 	def __str__(self) -> str: return common_str_slots(self, self.__slots__, ('parent',))
 	
 	def __repr__(self) -> str: return common_str_slots(self, self.__slots__, ('parent',))
 	
+	@staticmethod
+	def get_page_name(name: 'str', page: 'int') -> 'str':
+		return '{0}-P{1}'.format(name, page) if page > 0 else name
+	
+	def for_page(self, page: 'int') -> 'AtlasMaterialSetup':
+		# Копия настроек для дополнительной страницы атласа, с текстурами этой страницы
+		page_setup = type(self)(self.parent, self.get_page_name(self.name, page), None)
+		page_setup.order = self.order
+		page_setup.use_transparency = self.use_transparency
+		page_setup.alpha = self.alpha
+		page_setup.page = page
+		return page_setup
+	
 	def prepare_material_bpy(self) -> 'bpy.types.Material':
 		if self.material is not None:
 			return self.material
@@ -364,7 +485,7 @@ class AtlasMaterialSetup:
 					tmat.texture_slots.clear(slot_index)
 			tmat.diffuse_intensity = 1
 			tmat.diffuse_color = (1, 1, 1)
-			for atex_name, atex_setup in self.parent.prepare_all_atlas_textures().items():
+			for atex_name, atex_setup in self.parent.prepare_all_atlas_textures(self.page).items():
 				atex_setup.attach_to(tmat)
 			return self.material
 		except Exception as exc:
@@ -578,6 +699,10 @@ class Island:
 			return False
 		return True
 	
+	def get_box(self) -> 'Tuple[float, float, float, float]':
+		# min_x, min_y, max_x, max_y простыми float
+		return self.mn.x, self.mn.y, self.mx.x, self.mx.y
+	
 	def get_points(self) -> 'Sequence[mathutils.Vector]':
 		return self.mn, self.mx, mathutils.Vector((self.mn.x, self.mx.y)), mathutils.Vector((self.mx.x, self.mn.y))
 	
@@ -585,7 +710,10 @@ class Island:
 		return any(self.is_inside_vec2(x, epsilon=epsilon) for x in items)
 	
 	def is_intersect(self, other: 'Island', epsilon: 'float' = 0):
-		return any(self.is_inside_vec2(x, epsilon=epsilon) for x in other.get_points())
+		# Честное пересечение AABB: проверка углов пропускала крестообразные пересечения и вложенность
+		if self.mn is None or self.mx is None or other.mn is None or other.mx is None:
+			return False
+		return box_intersect(self.get_box(), other.get_box(), epsilon=epsilon)
 	
 	def extend_by_vec2(self, vec2: 'mathutils.Vector'):
 		if self.mn is None:
@@ -624,16 +752,32 @@ class Island:
 
 class IslandsBuilder:
 	# Занимается разбиением множества точек на прямоугольные непересекающиеся подмноджества
-	__slots__ = ('bboxes', 'merges')
+	__slots__ = ('grid', 'merges')
 	
-	def __init__(self):
-		self.bboxes = list()  # type: List[Island]
+	# Размер ячейки пространственного индекса по умолчанию, в пикселях текстуры
+	DEFAULT_CELL_SIZE = 32.0
+	
+	def __init__(self, cell_size: 'Optional[float]' = None):
+		# Острова хранятся в сетке: поиск пересечений не перебирает все острова
+		self.grid = BoxGrid(any_not_none(cell_size, self.DEFAULT_CELL_SIZE))  # type: BoxGrid
 		self.merges = 0  # Для диагностических целей
 	
 	def __str__(self) -> str: return common_str_slots(self, self.__slots__)
 	
 	def __repr__(self) -> str: return common_str_slots(self, self.__slots__)
 	
+	@property
+	def bboxes(self) -> 'List[Island]':
+		# В порядке добавления, как раньше хранилось в списке
+		return list(self.grid)
+	
+	def _grid_insert(self, bbox: 'Island'):
+		self.grid.insert(bbox, *bbox.get_box())
+	
+	def _find_intersect(self, bbox: 'Island', epsilon: 'float' = 0) -> 'Optional[Island]':
+		# Поиск первого (в порядке добавления) бокса, с которым пересекается текущий
+		return grid_first_intersect(self.grid, bbox.get_box(), Island.get_box, epsilon=epsilon)
+	
 	def add_bbox(self, bbox: 'Island', epsilon: 'float' = 0):
 		# Добавляет набор точек
 		if not bbox.is_valid():
@@ -641,32 +785,50 @@ class IslandsBuilder:
 		
 		bbox_to_add = bbox
 		while bbox_to_add is not None:
-			target_idx = -1
-			# Поиск первго бокса с которым пересекается текущий
-			for i in range(len(self.bboxes)):
-				if self.bboxes[i] is bbox_to_add:
-					raise ValueError("bbox already in bboxes:", (bbox_to_add, self.bboxes[i], self.bboxes))
-				# Эта оптимизация больше не прокатывает, т.к. есть обмен метаданными
-				# if self.bboxes[i].is_inside_bbox(bbox_to_add, epsilon=epsilon):
-				#     return  # Если втавляемый bbox внутри существующего, то ничего не надо делать
-				if self.bboxes[i].is_intersect(bbox_to_add, epsilon=epsilon):
-					target_idx = i
-					break
-			if target_idx == -1:
+			if bbox_to_add in self.grid:
+				raise ValueError("bbox already in bboxes:", (bbox_to_add, self.grid))
+			# Эта оптимизация больше не прокатывает, т.к. есть обмен метаданными
+			# if self.bboxes[i].is_inside_bbox(bbox_to_add, epsilon=epsilon):
+			#     return  # Если втавляемый bbox внутри существующего, то ничего не надо делать
+			ejected = self._find_intersect(bbox_to_add, epsilon=epsilon)
+			if ejected is None:
 				# Пересечение не найдено, добавляем
-				self.bboxes.append(bbox_to_add)
+				self._grid_insert(bbox_to_add)
 				bbox_to_add = None
 			else:
 				# Пересечение найдено - вытаскиваем, соединяем, пытаемся добавить еще раз
-				ejected = self.bboxes[target_idx]
-				del self.bboxes[target_idx]
-				# print("add_bbox: extending: ", (ejected, bbox_to_add))
-				# print("add_bbox: merges: ", self.merges)
-				# print("add_bbox: len(bboxes): ", len(self.bboxes))
+				self.grid.remove(ejected)
 				ejected.extend_by_bbox(bbox_to_add)
 				bbox_to_add = ejected
 				self.merges += 1
 	
+	def add_bboxes(self, bboxes: 'Iterable[Island]', epsilon: 'float' = 0):
+		# Пакетное добавление: имеющиеся и новые острова сливаются заметающей прямой до тех пор, пока сливать нечего.
+		# Группы те же, что даёт поочерёдное add_bbox, но без перезапусков поиска после каждого слияния.
+		islands = self.bboxes
+		for bbox in bboxes:
+			if not bbox.is_valid():
+				raise ValueError("Invalid bbox!")
+			islands.append(bbox)
+		groups = sweep_merge_boxes(
+			list(island.mn.x for island in islands), list(island.mn.y for island in islands),
+			list(island.mx.x for island in islands), list(island.mx.y for island in islands),
+			epsilon=epsilon
+		)
+		self.grid = BoxGrid(self.grid.cell_size)
+		for group in groups:
+			target = islands[group[0]]
+			for i in group[1:]:
+				target.extend_by_bbox(islands[i])
+				self.merges += 1
+			self._grid_insert(target)
+	
+	def insert_bbox(self, bbox: 'Island'):
+		# Добавляет готовый остров как есть, без слияния с пересекающимися
+		if not bbox.is_valid():
+			raise ValueError("Invalid bbox!")
+		self._grid_insert(bbox)
+	
 	def add_seq(
 			self, vec2s: 'Iterable[mathutils.Vector]',
 			attachment: 'AttachmentPerMaterial', epsilon: 'float' = 0
@@ -689,12 +851,14 @@ class UVBoxTransform:
 	__slots__ = (
 		'ax', 'ay', 'aw', 'ah',
 		'bx', 'by', 'bw', 'bh',
-		'attachment',
+		'rotated', 'attachment',
 	)
 	
-	def __init__(self, ax, ay, aw, ah, bx, by, bw, bh, attachment):
+	def __init__(self, ax, ay, aw, ah, bx, by, bw, bh, attachment, rotated=False):
 		self.ax, self.ay, self.aw, self.ah = ax, ay, aw, ah
 		self.bx, self.by, self.bw, self.bh = bx, by, bw, bh
+		# Бокс повёрнут на 90° по часовой: исходная ширина идёт по высоте целевого бокса
+		self.rotated = rotated  # type: bool
 		self.attachment = attachment  # type: Optional[AttachmentPerMaterial]
 	
 	def __str__(self) -> str: return common_str_slots(self, self.__slots__)
@@ -709,6 +873,8 @@ class UVBoxTransform:
 		uv = vec2.xy  # копирование
 		uv.x = (uv.x - self.ax) / self.aw if self.aw != 0 else 0.5
 		uv.y = (uv.y - self.ay) / self.ah if self.ah != 0 else 0.5
+		if self.rotated:
+			uv.x, uv.y = uv.y, 1.0 - uv.x
 		uv.x = uv.x * self.bw + self.bx
 		uv.y = uv.y * self.bh + self.by
 		return uv
@@ -730,8 +896,71 @@ class UVBoxTransform:
 	
 	def get_area_a(self):
 		return self.aw * self.ah
+	
+	def get_params(self) -> 'Tuple[float, ...]':
+		# Параметры для atlas_kernels.apply_box_transforms
+		return self.ax, self.ay, self.aw, self.ah, self.bx, self.by, self.bw, self.bh, 1.0 if self.rotated else 0.0
+	
+	@staticmethod
+	def apply_all(transforms: 'Sequence[UVBoxTransform]') -> 'int':
+		# То же, что apply() у каждого преобразования, но по мешам целиком, см. apply_uv_transforms
+		params = numpy.array(list(transform.get_params() for transform in transforms), dtype=numpy.float64).reshape(-1, 9)
+		return apply_uv_transforms(list(transform.attachment for transform in transforms), params)
+
+
+def apply_uv_transforms(attachments: 'Sequence[AttachmentPerMaterial]', params: 'numpy.ndarray') -> 'int':
+	# Применяет преобразования UV (параметры как у UVBoxTransform.get_params) к полигонам attachments[i]:
+	# для каждого меша номер преобразования для каждого лупа, одно чтение UV через foreach_get,
+	# преобразование массивами (atlas_kernels.apply_box_transforms) и одна запись через foreach_set.
+	per_mesh = dict()  # type: Dict[bpy.types.Mesh, List[Tuple[int, List[bpy.types.MeshPolygon]]]]
+	for index, attachment in enumerate(attachments):
+		for per_ob in attachment.per_ob.values():
+			per_mesh.setdefault(per_ob.mesh, list()).append((index, per_ob.polys))
+	counter = 0
+	for mesh, entries in per_mesh.items():
+		uv_data_original = mesh.uv_layers[KawaMeshCombiner.PROC_ORIGINAL_ATLAS_UV_NAME].data
+		uv_data_target = mesh.uv_layers[KawaMeshCombiner.PROC_TARGET_ATLAS_UV_NAME].data
+		original = foreach_get_array(uv_data_original, 'uv', numpy.float32, 2)
+		target = foreach_get_array(uv_data_target, 'uv', numpy.float32, 2)
+		loop_starts = foreach_get_array(mesh.polygons, 'loop_start', numpy.int32)
+		loop_totals = foreach_get_array(mesh.polygons, 'loop_total', numpy.int32)
+		poly_transforms = numpy.full(len(loop_starts), -1, dtype=numpy.int64)
+		for index, polys in entries:
+			poly_transforms[list(poly.index for poly in polys)] = index
+		loop_indices, _ = polygons_loop_indices(loop_starts, loop_totals)
+		loop_transforms = numpy.full(len(original), -1, dtype=numpy.int64)
+		loop_transforms[loop_indices] = numpy.repeat(poly_transforms, loop_totals)
+		target = apply_box_transforms(original, target, loop_transforms, params)
+		uv_data_target.foreach_set('uv', target.astype(numpy.float32).ravel())
+		counter += int(numpy.count_nonzero(loop_transforms >= 0))
+	return counter
 
 
+def island_uv_hashes(attachments: 'Sequence[AttachmentPerMaterial]') -> 'List[str]':
+	# Хеши исходных UV полигонов каждого острова (attachments[i]), для ключей кеша тайлов.
+	# Меши обходятся в порядке имён, лупы острова - в порядке полигонов меша.
+	per_mesh = dict()  # type: Dict[bpy.types.Mesh, List[Tuple[int, List[bpy.types.MeshPolygon]]]]
+	for index, attachment in enumerate(attachments):
+		for per_ob in attachment.per_ob.values():
+			per_mesh.setdefault(per_ob.mesh, list()).append((index, per_ob.polys))
+	digests = list(hashlib.sha1() for _ in attachments)
+	for mesh in sorted(per_mesh.keys(), key=lambda m: m.name):
+		original = foreach_get_array(mesh.uv_layers[KawaMeshCombiner.PROC_ORIGINAL_ATLAS_UV_NAME].data, 'uv', numpy.float32, 2)
+		loop_starts = foreach_get_array(mesh.polygons, 'loop_start', numpy.int32)
+		loop_totals = foreach_get_array(mesh.polygons, 'loop_total', numpy.int32)
+		poly_islands = numpy.full(len(loop_starts), -1, dtype=numpy.int64)
+		for index, polys in per_mesh[mesh]:
+			poly_islands[list(poly.index for poly in polys)] = index
+		loop_indices, _ = polygons_loop_indices(loop_starts, loop_totals)
+		loop_islands = numpy.repeat(poly_islands, loop_totals)
+		order = numpy.argsort(loop_islands, kind='mergesort')
+		islands, starts = numpy.unique(loop_islands[order], return_index=True)
+		ends = numpy.append(starts[1:], len(order))
+		for index, start, end in zip(islands.tolist(), starts.tolist(), ends.tolist()):
+			if index >= 0:
+				digests[index].update(original[loop_indices[order[start:end]]].tobytes())
+	return list(digest.hexdigest() for digest in digests)
+
 class KawaMeshCombiner:
 	L_TARGET_OBJECT = 'target_object'
 	L_UV0_ORIGINAL = 'atlas_original_uv'
@@ -745,6 +974,22 @@ class KawaMeshCombiner:
 	L_ATLAS_PADDING = 'atlas_padding'
 	L_ATLAS_EPSILON = 'atlas_epsilon'
 	L_ATLAS_SINGLE_ISLAND = 'atlas_single_island'
+	L_ATLAS_ISLANDS_MODE = 'atlas_islands_mode'
+	L_ATLAS_ISLANDS_WORKERS = 'atlas_islands_workers'
+	L_ATLAS_PACKER = 'atlas_packer'
+	L_ATLAS_PACK_TIME = 'atlas_pack_time'
+	L_ATLAS_PACK_WORKERS = 'atlas_pack_workers'
+	L_ATLAS_ALLOW_ROTATION = 'atlas_allow_rotation'
+	L_ATLAS_MIN_DENSITY = 'atlas_min_density'
+	L_ATLAS_MAX_PAGES = 'atlas_max_pages'
+	L_ATLAS_BAKE_MODE = 'atlas_bake_mode'
+	L_ATLAS_BAKE_CACHE = 'atlas_bake_cache'
+	L_ATLAS_BAKE_WORKERS = 'atlas_bake_workers'
+	L_BAKE_DILATION = 'bake_dilation'
+	L_BAKE_AA = 'bake_aa'
+	L_SPLIT_MODE = 'split_mode'
+	L_WELD_MODE = 'weld_mode'
+	L_TARGET_RESET_MODE = 'target_reset_mode'
 	L_ATLAS_MATERIALS = 'atlas_materials'
 	L_ATLAS_TEXTURE_PREFIX = 'atlas_texture_prefix'
 	L_ATLAS_TEXTURES = 'atlas_textures'
@@ -753,6 +998,68 @@ class KawaMeshCombiner:
 	L_ORIGINAL_OBJECTS = 'original_objects'
 	L_ORIGINAL_MATERIALS = 'original_materials'
 	
+	# Режимы поиска островов:
+	# BBOX - полигоны сливаются в острова по пересечению их bbox
+	# SWEEP - то же, что BBOX, но все полигоны материала сливаются разом заметающей прямой
+	# CONNECTED - острова это связные компоненты полигонов с общими вершинами и совпадающими UV
+	ATLAS_ISLANDS_MODES = ('BBOX', 'SWEEP', 'CONNECTED')
+	
+	# Упаковщики островов:
+	# BOX_PACK_2D - повторные вызовы mathutils.geometry.box_pack_2d, пока результат улучшается
+	# SKYLINE - детерминированный atlas_kernels.pack_boxes с перебором эвристик,
+	# если задан atlas_pack_time, то испытания продолжаются случайными порядками, пока не кончится время.
+	# Поворот островов на 90° (atlas_allow_rotation) умеет только SKYLINE.
+	ATLAS_PACKERS = ('BOX_PACK_2D', 'SKYLINE')
+	
+	# Страницы атласа:
+	# если задан atlas_min_density (пикселей атласа на пиксель исходной текстуры), то материалы, которые
+	# не влезают в atlas_size с такой плотностью, переносятся на дополнительные страницы со своими текстурами и материалами.
+	# atlas_max_pages ограничивает число страниц, 0 - без ограничения.
+	
+	# Способы получения текстур атласа:
+	# RENDER - запекание bpy.ops.object.bake_image() для каждого типа текстуры
+	# BLIT - перенос пикселей из картинок исходных материалов без рендера, только для типов из BLIT_TEXTURE_TYPES,
+	# остальные типы всё равно запекаются рендером
+	ATLAS_BAKE_MODES = ('RENDER', 'BLIT')
+	BLIT_TEXTURE_TYPES = ('TEXTURE', 'EMIT')
+	
+	# Кеш запечённых тайлов (atlas_bake_cache) лежит в папке рядом с .blend файлом: <имя файла><BAKE_CACHE_SUFFIX>
+	BAKE_CACHE_SUFFIX = '.kawa_bake_cache'
+	# Наибольший размер каталога кеша тайлов, лишние тайлы удаляются после запекания (TileCache.prune)
+	BAKE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+	# bake_dilation по умолчанию при atlas_bake_cache: поля bake_margin вокруг тайлов из кеша не хранятся,
+	# их восстанавливает atlas_dilate_texture. Как прежний bake_margin.
+	BAKE_CACHE_DILATION = 64
+	
+	# Наименьший bake_margin при запекании, если края расширяются отдельно (bake_dilation), см. get_dilation_bake_margin
+	BAKE_DILATION_MARGIN = 2
+	
+	# Сглаживание запекания (bake_aa), глобально или для материала: число сэмплов Blender Internal или
+	# AUTO - по итоговому масштабу каждого острова, острова с разным сглаживанием запекаются отдельными проходами.
+	# По умолчанию, как и раньше, 16, а в fast_mode всегда 5.
+	BAKE_AA_MODES = ('5', '8', '11', '16', 'AUTO')
+	# Для AUTO: (наименьший масштаб, сглаживание), масштаб - пикселей атласа на пиксель исходной текстуры, иначе 16
+	BAKE_AA_AUTO_LEVELS = ((0.95, '5'), (0.5, '8'), (0.25, '11'))
+	
+	# Способы разбиения копий исходных объектов по материалам:
+	# OPERATORS - bpy.ops.object.duplicate и bpy.ops.mesh.separate(type='MATERIAL')
+	# BMESH - через bmesh и Mesh.copy, без операторов и выделения (см. split_by_material_bmesh)
+	SPLIT_MODES = ('OPERATORS', 'BMESH')
+	# Способы слияния вершин на швах после объединения:
+	# OPERATORS - bpy.ops.mesh.remove_doubles по non-manifold рёбрам в режиме редактирования
+	# KDTREE - commons.weld_boundary_verts, без операторов и режима редактирования
+	WELD_MODES = ('OPERATORS', 'KDTREE')
+	WELD_DISTANCE = 1e-06
+	# Способы очистки целевых объектов перед объединением:
+	# CLEAR - очистка старой меши через bmesh и удаление шейпкеев, UV и vertex colors по одному
+	# REPLACE - новая пустая меша вместо старой (см. replace_target_mesh)
+	TARGET_RESET_MODES = ('CLEAR', 'REPLACE')
+	# Свойства, которые переносятся со старой меши цели на новую при REPLACE
+	TARGET_MESH_PROPERTIES = ('use_auto_smooth', 'auto_smooth_angle', 'show_double_sided')
+	
+	# Испытаний упаковки в одной задаче пула процессов
+	PACK_TRIALS_PER_TASK = 4
+	
 	# Имена временных объектов
 	PROC_ORIGINAL_ATLAS_UV_NAME = "__KawaMeshCombiner_UV_Main_Original"
 	PROC_ORIGINAL_LM_UV_NAME = "__KawaMeshCombiner_UV_LightMap_Original"
@@ -760,6 +1067,11 @@ class KawaMeshCombiner:
 	PROC_TARGET_LM_UV_NAME = "__KawaMeshCombiner_UV_LightMap_Target"
 	PROC_OBJECT_NAME = "__KawaMeshCombiner_Processing_Object"
 	PROC_MESH_NAME = "__KawaMeshCombiner_Processing_Mesh"
+	GARBAGE_MESH_NAME = "__KawaMeshCombiner_Garbage_Mesh"
+	LOOP_INDEX_LAYER_NAME = "__KawaMeshCombiner_Loop_Index"
+	
+	# На сколько ячеек по стороне текстуры делится пространственный индекс островов
+	ISLANDS_GRID_DIVISIONS = 64
 	
 	@staticmethod
 	def validate_uv_index(value: 'UVLayerIndex', field_name: 'str') -> 'UVLayerIndex':
@@ -789,6 +1101,13 @@ class KawaMeshCombiner:
 			return None
 		return value
 	
+	@staticmethod
+	def validate_choice(value: 'str', choices: 'Collection[str]', field_name: 'str') -> 'Optional[str]':
+		if value is not None and value not in choices:
+			log.warning("Invalid config value for %s='%s', supported values: %s", field_name, value, choices)
+			return None
+		return value
+	
 	@staticmethod
 	def validate_size_int(value: 'SizeInt', field_name: 'str') -> 'Optional[SizeInt]':
 		if value is not None and is_valid_size_int(value):
@@ -823,10 +1142,13 @@ class KawaMeshCombiner:
 	__slots__ = (
 		'target_object_name', 'atlas_material_name', 'fast_mode',
 		'atlas_ignore', 'uv0_original', 'uv0_target', 'atlas_texture_prefix',
-		'original_size', 'atlas_size', 'atlas_padding', 'atlas_epsilon', 'atlas_single_island',
+		'original_size', 'atlas_size', 'atlas_padding', 'atlas_epsilon', 'atlas_single_island', 'atlas_islands_mode',
+		'atlas_islands_workers', 'atlas_packer', 'atlas_pack_time', 'atlas_pack_workers', 'atlas_allow_rotation',
+		'atlas_min_density', 'atlas_max_pages', 'atlas_page_textures', 'atlas_bake_mode', 'atlas_bake_cache',
+		'atlas_bake_workers', 'bake_dilation', 'bake_aa', 'split_mode', 'weld_mode', 'target_reset_mode',
 		'lm_ignore', 'uv1_original', 'uv1_target',
 		'original_objects', 'original_materials', 'atlas_materials', 'atlas_textures',
-		'created_proc_objects'
+		'created_proc_objects', 'garbage_meshes', 'selection'
 	)
 	
 	def __init__(self):
@@ -850,6 +1172,25 @@ class KawaMeshCombiner:
 		self.atlas_padding = 1.0
 		self.atlas_epsilon = 1.0
 		self.atlas_single_island = False
+		self.atlas_islands_mode = 'BBOX'
+		self.atlas_islands_workers = 0  # 0 - без пула процессов
+		self.atlas_packer = 'BOX_PACK_2D'
+		self.atlas_pack_time = 0.0  # Секунды, 0 - без бюджета времени
+		self.atlas_pack_workers = 0  # 0 - без пула процессов
+		self.atlas_allow_rotation = False
+		self.atlas_min_density = 0.0  # 0 - одна страница, острова сжимаются до atlas_size
+		self.atlas_max_pages = 0  # 0 - без ограничения
+		self.atlas_page_textures = dict()  # type: Dict[Tuple[int, str], AtlasTextureSetup]
+		self.atlas_bake_mode = 'RENDER'
+		self.atlas_bake_cache = False
+		self.atlas_bake_workers = 0  # 0 - запекание в этом процессе
+		self.bake_dilation = 0  # Пиксели, 0 - края расширяет рендер через bake_margin
+		self.bake_aa = None  # type: Optional[str]
+		self.split_mode = 'OPERATORS'
+		self.weld_mode = 'OPERATORS'
+		self.target_reset_mode = 'CLEAR'
+		self.garbage_meshes = list()  # type: List[bpy.types.Mesh]
+		self.selection = SelectionManager()
 		
 		self.lm_ignore = True
 		
@@ -895,6 +1236,65 @@ class KawaMeshCombiner:
 		atlas_single_island = cls.validate_bool(raw_setup.get(cls.L_ATLAS_SINGLE_ISLAND), cls.L_ATLAS_SINGLE_ISLAND)
 		general_setup.atlas_single_island = any_not_none(atlas_single_island, general_setup.atlas_single_island)
 		
+		atlas_islands_mode = cls.validate_choice(raw_setup.get(cls.L_ATLAS_ISLANDS_MODE), cls.ATLAS_ISLANDS_MODES, cls.L_ATLAS_ISLANDS_MODE)
+		general_setup.atlas_islands_mode = any_not_none(atlas_islands_mode, general_setup.atlas_islands_mode)
+		
+		atlas_islands_workers = cls.validate_int_positive_or_zero(raw_setup.get(cls.L_ATLAS_ISLANDS_WORKERS), cls.L_ATLAS_ISLANDS_WORKERS)
+		general_setup.atlas_islands_workers = any_not_none(atlas_islands_workers, general_setup.atlas_islands_workers)
+		
+		atlas_packer = cls.validate_choice(raw_setup.get(cls.L_ATLAS_PACKER), cls.ATLAS_PACKERS, cls.L_ATLAS_PACKER)
+		general_setup.atlas_packer = any_not_none(atlas_packer, general_setup.atlas_packer)
+		
+		atlas_pack_time = cls.validate_float(raw_setup.get(cls.L_ATLAS_PACK_TIME), cls.L_ATLAS_PACK_TIME)
+		general_setup.atlas_pack_time = any_not_none(atlas_pack_time, general_setup.atlas_pack_time)
+		
+		atlas_pack_workers = cls.validate_int_positive_or_zero(raw_setup.get(cls.L_ATLAS_PACK_WORKERS), cls.L_ATLAS_PACK_WORKERS)
+		general_setup.atlas_pack_workers = any_not_none(atlas_pack_workers, general_setup.atlas_pack_workers)
+		
+		atlas_allow_rotation = cls.validate_bool(raw_setup.get(cls.L_ATLAS_ALLOW_ROTATION), cls.L_ATLAS_ALLOW_ROTATION)
+		general_setup.atlas_allow_rotation = any_not_none(atlas_allow_rotation, general_setup.atlas_allow_rotation)
+		if general_setup.atlas_allow_rotation and general_setup.atlas_packer != 'SKYLINE':
+			log.warning("%s is supported only by %s='SKYLINE', ignoring.", cls.L_ATLAS_ALLOW_ROTATION, cls.L_ATLAS_PACKER)
+			general_setup.atlas_allow_rotation = False
+		
+		atlas_min_density = cls.validate_float(raw_setup.get(cls.L_ATLAS_MIN_DENSITY), cls.L_ATLAS_MIN_DENSITY)
+		general_setup.atlas_min_density = any_not_none(atlas_min_density, general_setup.atlas_min_density)
+		
+		atlas_max_pages = cls.validate_int_positive_or_zero(raw_setup.get(cls.L_ATLAS_MAX_PAGES), cls.L_ATLAS_MAX_PAGES)
+		general_setup.atlas_max_pages = any_not_none(atlas_max_pages, general_setup.atlas_max_pages)
+		
+		atlas_bake_mode = cls.validate_choice(raw_setup.get(cls.L_ATLAS_BAKE_MODE), cls.ATLAS_BAKE_MODES, cls.L_ATLAS_BAKE_MODE)
+		general_setup.atlas_bake_mode = any_not_none(atlas_bake_mode, general_setup.atlas_bake_mode)
+		
+		atlas_bake_cache = cls.validate_bool(raw_setup.get(cls.L_ATLAS_BAKE_CACHE), cls.L_ATLAS_BAKE_CACHE)
+		general_setup.atlas_bake_cache = any_not_none(atlas_bake_cache, general_setup.atlas_bake_cache)
+		
+		atlas_bake_workers = cls.validate_int_positive_or_zero(raw_setup.get(cls.L_ATLAS_BAKE_WORKERS), cls.L_ATLAS_BAKE_WORKERS)
+		general_setup.atlas_bake_workers = any_not_none(atlas_bake_workers, general_setup.atlas_bake_workers)
+		if general_setup.atlas_bake_workers > 0 and general_setup.atlas_bake_cache:
+			log.warning("%s is ignored, because %s is set.", cls.L_ATLAS_BAKE_WORKERS, cls.L_ATLAS_BAKE_CACHE)
+		
+		bake_dilation = cls.validate_int_positive_or_zero(raw_setup.get(cls.L_BAKE_DILATION), cls.L_BAKE_DILATION)
+		general_setup.bake_dilation = any_not_none(bake_dilation, general_setup.bake_dilation)
+		if general_setup.atlas_bake_cache and general_setup.bake_dilation <= 0:
+			log.warning(
+				"%s requires %s > 0 to rebuild margins around cached tiles, using %d.",
+				cls.L_ATLAS_BAKE_CACHE, cls.L_BAKE_DILATION, cls.BAKE_CACHE_DILATION
+			)
+			general_setup.bake_dilation = cls.BAKE_CACHE_DILATION
+		
+		bake_aa = cls.validate_choice(raw_setup.get(cls.L_BAKE_AA), cls.BAKE_AA_MODES, cls.L_BAKE_AA)
+		general_setup.bake_aa = any_not_none(bake_aa, general_setup.bake_aa)
+		
+		split_mode = cls.validate_choice(raw_setup.get(cls.L_SPLIT_MODE), cls.SPLIT_MODES, cls.L_SPLIT_MODE)
+		general_setup.split_mode = any_not_none(split_mode, general_setup.split_mode)
+		
+		weld_mode = cls.validate_choice(raw_setup.get(cls.L_WELD_MODE), cls.WELD_MODES, cls.L_WELD_MODE)
+		general_setup.weld_mode = any_not_none(weld_mode, general_setup.weld_mode)
+		
+		target_reset_mode = cls.validate_choice(raw_setup.get(cls.L_TARGET_RESET_MODE), cls.TARGET_RESET_MODES, cls.L_TARGET_RESET_MODE)
+		general_setup.target_reset_mode = any_not_none(target_reset_mode, general_setup.target_reset_mode)
+		
 		lm_ignore = cls.validate_bool(raw_setup.get(cls.L_LM_IGNORE), cls.L_LM_IGNORE)
 		general_setup.lm_ignore = any_not_none(lm_ignore, general_setup.lm_ignore)
 		
@@ -955,13 +1355,20 @@ class KawaMeshCombiner:
 			self.original_materials[omat] = omat_setup
 		return omat_setup
 	
-	def get_atlas_material_setup(self, amat_name: 'str') -> 'AtlasMaterialSetup':
+	def get_atlas_material_setup(self, amat_name: 'str', page: 'int' = 0) -> 'AtlasMaterialSetup':
 		if not is_valid_string(amat_name):
 			raise ValueError("amat_name is not valid Material name", amat_name)
 		amat_setup = self.atlas_materials.get(amat_name)
 		if amat_setup is None:
 			amat_setup = AtlasMaterialSetup(self, amat_name, None)
 			self.atlas_materials[amat_name] = amat_setup
+		if page > 0:
+			page_name = AtlasMaterialSetup.get_page_name(amat_name, page)
+			page_setup = self.atlas_materials.get(page_name)
+			if page_setup is None:
+				page_setup = amat_setup.for_page(page)
+				self.atlas_materials[page_name] = page_setup
+			return page_setup
 		return amat_setup
 	
 	def get_all_original_materials(self) -> 'OriginalMaterialSetups':
@@ -975,10 +1382,17 @@ class KawaMeshCombiner:
 				original_materials[omat] = mat_setup
 		return original_materials
 	
-	def prepare_all_atlas_textures(self) -> 'AtlasTextureSetups':
+	def prepare_all_atlas_textures(self, page: 'int' = 0) -> 'AtlasTextureSetups':
 		# копирует self.target_texture и инициализирует текструры
+		# Для дополнительных страниц атласа используются копии настроек (AtlasTextureSetup.for_page)
 		atlas_textures = dict()
 		for atex_setup in self.atlas_textures.values():
+			if page > 0:
+				page_setup = self.atlas_page_textures.get((page, atex_setup.type))
+				if page_setup is None:
+					page_setup = atex_setup.for_page(page)
+					self.atlas_page_textures[(page, atex_setup.type)] = page_setup
+				atex_setup = page_setup
 			atex_setup.prepare_texture()
 			atlas_textures[atex_setup.type] = atex_setup
 		return atlas_textures
@@ -1004,6 +1418,9 @@ class KawaMeshCombiner:
 				if tobj is None:
 					raise ConfigurationError("Target object does not exist!", tobj_name)
 				tobj.hide = False  # Необходимо, т.к. некоторые операторы не работают на скрытых объектах
+				if self.target_reset_mode == 'REPLACE':
+					self.replace_target_mesh(tobj)
+					continue
 				tobj_mesh = get_mesh_safe(tobj)
 				
 				# Очистка геометрии
@@ -1036,6 +1453,109 @@ class KawaMeshCombiner:
 			except Exception as exc:
 				raise RuntimeError("Error preparing target object!", tobj_name) from exc
 	
+	def replace_target_mesh(self, tobj: 'bpy.types.Object') -> 'bpy.types.Mesh':
+		# Вместо очистки старой меши - новая пустая меша с тем же именем, без шейпкеев, UV, vertex colors и материалов.
+		# Все пользователи старой меши переключаются на новую через user_remap, сама старая удаляется в конце run().
+		old_mesh = get_mesh_safe(tobj)
+		mesh_name = old_mesh.name
+		old_mesh.name = self.GARBAGE_MESH_NAME
+		new_mesh = bpy.data.meshes.new(mesh_name)
+		for prop in self.TARGET_MESH_PROPERTIES:
+			setattr(new_mesh, prop, getattr(old_mesh, prop))
+		for key in old_mesh.keys():
+			new_mesh[key] = old_mesh[key]
+		old_mesh.user_remap(new_mesh)
+		self.garbage_meshes.append(old_mesh)
+		log.info("Replaced Mesh='%s' of target Object='%s' with a new empty one.", mesh_name, tobj.name)
+		return new_mesh
+	
+	def remove_garbage_meshes(self):
+		for mesh in self.garbage_meshes:
+			if mesh.users == 0:
+				bpy.data.meshes.remove(mesh)
+			else:
+				log.warning("Mesh='%s' is still used by %d users and will not be removed.", mesh.name, mesh.users)
+		self.garbage_meshes.clear()
+	
+	def split_by_material_operators(self, oobj: 'bpy.types.Object') -> 'List[bpy.types.Object]':
+		# Копия объекта, разбитая по материалам операторами duplicate и separate
+		self.selection.deselect_all()
+		self.selection.select(oobj)
+		if len(bpy.context.selected_objects) != 1:
+			raise AssertionError("len(bpy.context.selected_objects) != 1", len(bpy.context.selected_objects))
+		ensure_op_finished(bpy.ops.object.duplicate(), name='bpy.ops.object.duplicate()')
+		if len(bpy.context.selected_objects) != 1:
+			raise AssertionError("len(bpy.context.selected_objects) != 1", len(bpy.context.selected_objects))
+		bpy.context.selected_objects[0].hide = False  # Необходимо, т.к. некоторые операторы не работают на скрытых объектах
+		ensure_op_finished(bpy.ops.mesh.separate(type='MATERIAL'), name="bpy.ops.mesh.separate(type='MATERIAL')")
+		# print(list(bpy.context.selected_objects))
+		split_objects = list(bpy.context.selected_objects)
+		self.selection.track(split_objects)
+		return split_objects
+	
+	@classmethod
+	def split_by_material_bmesh(cls, oobj: 'bpy.types.Object') -> 'List[bpy.types.Object]':
+		# То же, что split_by_material_operators, но без операторов и выделения.
+		# Исходная меша читается в bmesh один раз, полигоны каждого материала копируются bmesh.ops.duplicate
+		# в новый bmesh с теми же слоями (UV, vertex colors, группы вершин, шейпкеи и т.д., см. copy_bmesh_layers),
+		# который пишется в новую мешу. Шейпкеи переносятся отдельно, т.к. to_mesh не создаёт их у новой меши.
+		# Пользовательские нормали (split normals) в bmesh недоступны, по этому они читаются из исходной меши заранее,
+		# а лупы частей сопоставляются с исходными через временный int слой с индексом лупа.
+		# У каждой части остаётся один слот материала.
+		omesh = get_mesh_safe(oobj)
+		split_objects = list()  # type: List[bpy.types.Object]
+		normals = get_custom_normals(omesh)
+		bm = bmesh.new()
+		try:
+			bm.from_mesh(omesh)
+			if normals is not None:
+				# Порядок лупов bmesh после from_mesh совпадает с порядком лупов меши
+				loop_index_layer = bm.loops.layers.int.new(cls.LOOP_INDEX_LAYER_NAME)
+				loop_index = 0
+				for face in bm.faces:
+					for loop in face.loops:
+						loop[loop_index_layer] = loop_index
+						loop_index += 1
+			faces_per_index = dict()  # type: Dict[int, List[bmesh.types.BMFace]]
+			for face in bm.faces:
+				faces_per_index.setdefault(face.material_index, list()).append(face)
+			for mat_index in sorted(faces_per_index.keys()):
+				material = oobj.material_slots[mat_index].material if mat_index < len(oobj.material_slots) else None
+				pmesh = bpy.data.meshes.new(omesh.name)
+				pmesh.materials.append(material)
+				pobj = oobj.copy()
+				pobj.data = pmesh
+				bpy.context.scene.objects.link(pobj)
+				pobj.select = False  # Копия выделенного оригинала тоже выделена, а SelectionManager о ней не знает
+				pobj.hide = False  # Необходимо, т.к. некоторые операторы не работают на скрытых объектах
+				if len(pobj.material_slots) > 0:
+					pobj.material_slots[0].link = 'DATA'
+				part = bmesh.new()
+				try:
+					copy_bmesh_layers(bm, part)
+					bmesh.ops.duplicate(bm, geom=faces_per_index[mat_index], dest=part)
+					for face in part.faces:
+						face.material_index = 0
+					loop_map = None  # type: Optional[List[int]]
+					if normals is not None:
+						# Лупы to_mesh пишет в том же порядке, что и обход полигонов и их лупов
+						part_layer = part.loops.layers.int.get(cls.LOOP_INDEX_LAYER_NAME)
+						loop_map = list(loop[part_layer] for face in part.faces for loop in face.loops)
+						part.loops.layers.int.remove(part_layer)
+					part.to_mesh(pmesh)
+					for prop in cls.TARGET_MESH_PROPERTIES:
+						setattr(pmesh, prop, getattr(omesh, prop))
+					if loop_map is not None:
+						set_custom_normals(pmesh, normals[loop_map])
+					if omesh.shape_keys is not None:
+						copy_shape_keys(omesh, part, pobj)
+				finally:
+					part.free()
+				split_objects.append(pobj)
+		finally:
+			bm.free()
+		return split_objects
+	
 	def prepare_proc_objects(self):
 		# Создает рабочую копию оригинального объекта, разбивает её на части, выбирает нужные UV
 		proc_all = list()  # type: List[ProcessingObjectSetup]
@@ -1056,20 +1576,14 @@ class KawaMeshCombiner:
 			log.info("Global lightmap_ignore=True: Going to IGNORE Lightmap (UV1) Layers...")
 		
 		for oobj_setup in self.original_objects.values():
-			ensure_deselect_all()
 			oobj = oobj_setup.object
-			oobj.select = True
-			if len(bpy.context.selected_objects) != 1:
-				raise AssertionError("len(bpy.context.selected_objects) != 1", len(bpy.context.selected_objects))
-			ensure_op_finished(bpy.ops.object.duplicate(), name='bpy.ops.object.duplicate()')
-			if len(bpy.context.selected_objects) != 1:
-				raise AssertionError("len(bpy.context.selected_objects) != 1", len(bpy.context.selected_objects))
-			bpy.context.selected_objects[0].hide = False  # Необходимо, т.к. некоторые операторы не работают на скрытых объектах
-			ensure_op_finished(bpy.ops.mesh.separate(type='MATERIAL'), name="bpy.ops.mesh.separate(type='MATERIAL')")
-			# print(list(bpy.context.selected_objects))
-			for sel_obj in bpy.context.selected_objects:
+			if self.split_mode == 'BMESH':
+				split_objects = self.split_by_material_bmesh(oobj)
+			else:
+				split_objects = self.split_by_material_operators(oobj)
+			for sel_obj in split_objects:
 				try:
-					bpy.context.scene.objects.active = sel_obj
+					self.selection.set_active(sel_obj)
 					pobj_setup = ProcessingObjectSetup(self, sel_obj, oobj_setup)
 					proc_all.append(pobj_setup)
 					pobj_mat = pobj_setup.get_material_bpy()  # test for Exception as well
@@ -1097,15 +1611,9 @@ class KawaMeshCombiner:
 								mesh.uv_textures[uv0_original_name].name, oobj.name, pobj_mat.name
 							)
 							# Копия для цели
-							bpy.context.scene.objects.active = sel_obj
-							mesh.uv_textures[uv0_original_name].active = True
-							ensure_op_finished(bpy.ops.mesh.uv_texture_add(), name='bpy.ops.mesh.uv_texture_add')
-							mesh.uv_textures.active.name = KawaMeshCombiner.PROC_TARGET_ATLAS_UV_NAME
+							copy_uv_layer(mesh, uv0_original_name, KawaMeshCombiner.PROC_TARGET_ATLAS_UV_NAME)
 							# Копия для исходника
-							bpy.context.scene.objects.active = sel_obj
-							mesh.uv_textures[uv0_original_name].active = True
-							ensure_op_finished(bpy.ops.mesh.uv_texture_add(), name='bpy.ops.mesh.uv_texture_add')
-							mesh.uv_textures.active.name = KawaMeshCombiner.PROC_ORIGINAL_ATLAS_UV_NAME
+							copy_uv_layer(mesh, uv0_original_name, KawaMeshCombiner.PROC_ORIGINAL_ATLAS_UV_NAME)
 					
 					if global_do_lm:
 						uv1_original_name = oobj_setup.get_uv1_original()
@@ -1115,15 +1623,9 @@ class KawaMeshCombiner:
 								mesh.uv_textures[uv1_original_name].name, oobj.name, pobj_mat.name
 							)
 							# Копия для цели
-							bpy.context.scene.objects.active = sel_obj
-							mesh.uv_textures[uv1_original_name].active = True
-							ensure_op_finished(bpy.ops.mesh.uv_texture_add(), name='bpy.ops.mesh.uv_texture_add')
-							mesh.uv_textures.active.name = KawaMeshCombiner.PROC_TARGET_LM_UV_NAME
+							copy_uv_layer(mesh, uv1_original_name, KawaMeshCombiner.PROC_TARGET_LM_UV_NAME)
 							# Копия для исходника
-							bpy.context.scene.objects.active = sel_obj
-							mesh.uv_textures[uv1_original_name].active = True
-							ensure_op_finished(bpy.ops.mesh.uv_texture_add(), name='bpy.ops.mesh.uv_texture_add')
-							mesh.uv_textures.active.name = KawaMeshCombiner.PROC_ORIGINAL_LM_UV_NAME
+							copy_uv_layer(mesh, uv1_original_name, KawaMeshCombiner.PROC_ORIGINAL_LM_UV_NAME)
 					
 					if do_atlas:
 						proc_main.append(pobj_setup)
@@ -1143,15 +1645,33 @@ class KawaMeshCombiner:
 					def log_remove(name, _):
 						log.info("Removing UV-Layer='%s' from Object='%s' Material='%s'", name, oobj.name, pobj_mat.name)
 					
-					remove_uv_layer_by_condition(mesh, should_remove, log_remove)
+					remove_uv_layers(mesh, should_remove, log_remove)
 				
 				except Exception as exc:
 					raise RuntimeError("Error preparing processing object!", oobj.name, sel_obj) from exc
-		ensure_deselect_all()
+		self.selection.deselect_all()
 		return proc_all, proc_main, proc_lightmap, proc_none
 	
+	def atlas_islands_cell_size(self, mat_setup: 'OriginalMaterialSetup') -> 'float':
+		# Ячейка сетки - доля от размера текстуры, т.к. координаты островов в пикселях текстуры
+		return max(mat_setup.get_original_size()) / self.ISLANDS_GRID_DIVISIONS
+	
+	def atlas_read_uv_arrays(
+			self, mesh: 'bpy.types.Mesh', mat_setup: 'OriginalMaterialSetup'
+	) -> 'Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]':
+		# Все UV и структура полигонов читаются разом, без создания Vector на каждый луп
+		mat_size_x, mat_size_y = mat_setup.get_original_size()
+		loop_uvs = foreach_get_array(mesh.uv_layers[self.PROC_ORIGINAL_ATLAS_UV_NAME].data, 'uv', numpy.float32, 2)
+		# Преобразование в размеры текстуры
+		loop_uvs *= numpy.array((mat_size_x, mat_size_y), dtype=numpy.float32)
+		loop_starts = foreach_get_array(mesh.polygons, 'loop_start', numpy.int32)
+		loop_totals = foreach_get_array(mesh.polygons, 'loop_total', numpy.int32)
+		return loop_uvs, loop_starts, loop_totals
+	
 	def atlas_find_islands(self, proc_objects: 'Iterable[ProcessingObjectSetup]') -> 'IslandsBuilders':
 		# Выполняет поиск островов на заданных объектах и материалах
+		if self.atlas_islands_workers > 0:
+			return self.atlas_find_islands_parallel(proc_objects)
 		builders = dict()  # type: IslandsBuilders
 		for pobj_setup in proc_objects:
 			find_obj_start = time.perf_counter()
@@ -1160,46 +1680,59 @@ class KawaMeshCombiner:
 			mat = pobj_setup.get_material_bpy()
 			mat_setup = self.get_original_material_setup(mat)
 			log.info("Looking for islands in Object='%s', Material='%s'...", pobj_setup.original.object.name, mat_setup.material.name)
+			uv_data = mesh.uv_layers.get(self.PROC_ORIGINAL_ATLAS_UV_NAME).data  # type: List[bpy.types.MeshUVLoop]
+			epsilon = mat_setup.get_atlas_epsilon()
 			builder = builders.get(mat)
 			if builder is None:
-				builder = IslandsBuilder()
+				builder = IslandsBuilder(cell_size=self.atlas_islands_cell_size(mat_setup))
 				builders[mat] = builder
-			uv_data = mesh.uv_layers.get(self.PROC_ORIGINAL_ATLAS_UV_NAME).data  # type: List[bpy.types.MeshUVLoop]
-			epsilon = mat_setup.get_atlas_epsilon()
-			mat_size_x, mat_size_y = mat_setup.get_original_size()
 			polygons = list(mesh.polygons)
+			loop_uvs, loop_starts, loop_totals = self.atlas_read_uv_arrays(mesh, mat_setup)
 			if mat_setup.get_atlas_single_island():
 				# Режим одного острова: все точки зарасыватся в один bbox
-				vec2s = list()
-				for poly in mesh.polygons:
-					for loop in poly.loop_indices:
-						vec2 = uv_data[loop].uv.xy  # type: mathutils.Vector
-						# Преобразование в размеры текстуры
-						vec2.x *= mat_size_x
-						vec2.y *= mat_size_y
-						vec2s.append(vec2)
-				builder.add_seq(vec2s, AttachmentPerMaterial(mat_setup, {
-					pobj_setup.object: AttachmentPerObject(pobj_setup.object, mesh, polygons)
-				}), epsilon=epsilon)
+				if len(loop_uvs) == 0:
+					log.warning("There is no UV loops in Object='%s', Material='%s'!", pobj_setup.original.object.name, mat.name)
+				else:
+					mn, mx = loop_uvs.min(axis=0), loop_uvs.max(axis=0)
+					builder.add_bbox(Island(mathutils.Vector(mn), mathutils.Vector(mx), AttachmentPerMaterial(mat_setup, {
+						pobj_setup.object: AttachmentPerObject(pobj_setup.object, mesh, polygons)
+					})), epsilon=epsilon)
+			elif mat_setup.get_atlas_islands_mode() == 'CONNECTED':
+				try:
+					# Режим связности: острова - компоненты полигонов, соединенных общими вершинами с общими UV
+					loop_vertices = foreach_get_array(mesh.loops, 'vertex_index', numpy.int32)
+					islands = connected_islands(
+						loop_starts.tolist(), loop_totals.tolist(), loop_vertices.tolist(), loop_uvs.ravel().tolist(), epsilon=epsilon
+					)
+					# Пересекающиеся компоненты (зеркальные или наложенные развёртки) сливаются в общий бокс, как в BBOX
+					builder.add_bboxes(list(
+						Island(mathutils.Vector((mnx, mny)), mathutils.Vector((mxx, mxy)), AttachmentPerMaterial(
+							mat_setup, {obj: AttachmentPerObject(obj, mesh, list(polygons[i] for i in poly_indices))}
+						)) for mnx, mny, mxx, mxy, poly_indices in islands
+					), epsilon=epsilon)
+				except Exception as exc:
+					raise RuntimeError("Error searching connected islands!", mat_setup, uv_data, obj, mesh, builder) from exc
 			else:
 				try:
-					# Оптимизация. Сортировка от большей площади к меньшей,
-					# что бы сразу сбелать большие боксы и реже пере-расширять их.
-					polygons.sort(key=lambda p: uv_area(p, uv_data), reverse=True)
+					# Границы всех полигонов считаются векторно
+					polys_mn, polys_mx = polygons_bounds(loop_uvs, loop_starts, loop_totals)
+					polys_mn, polys_mx = polys_mn.tolist(), polys_mx.tolist()
 					
-					for poly in polygons:
-						# if self.stat_islands_poly % 1000 == 0:
-						# 	log.info('Processed polygons: %d', self.stat_islands_poly)
-						# 	log.info("Current (original) object='%s' material='%s'", pobj_setup.original_object.name, mat.name)
-						vec2s = list()
-						for loop in poly.loop_indices:
-							vec2 = uv_data[loop].uv.xy  # type: mathutils.Vector
-							# Преобразование в размеры текстуры
-							vec2.x *= mat_size_x
-							vec2.y *= mat_size_y
-							vec2s.append(vec2)
-						builder.add_seq(vec2s, AttachmentPerMaterial(mat_setup, {obj: AttachmentPerObject(obj, mesh, [poly])}), epsilon=epsilon)
-				# self.stat_islands_poly += 1
+					def poly_island(i: 'int') -> 'Island':
+						return Island(mathutils.Vector(polys_mn[i]), mathutils.Vector(polys_mx[i]), AttachmentPerMaterial(
+							mat_setup, {obj: AttachmentPerObject(obj, mesh, [polygons[i]])}
+						))
+					
+					if mat_setup.get_atlas_islands_mode() == 'SWEEP':
+						# Все боксы разом, порядок добавления не важен
+						builder.add_bboxes(list(poly_island(i) for i in range(len(polygons))), epsilon=epsilon)
+					else:
+						# Оптимизация. Сортировка от большей площади к меньшей,
+						# что бы сразу сбелать большие боксы и реже пере-расширять их.
+						order = uv_areas_order(loop_uvs, loop_starts, loop_totals).tolist()
+						
+						for i in order:
+							builder.add_bbox(poly_island(i), epsilon=epsilon)
 				except Exception as exc:
 					raise RuntimeError("Error searching multiple islands!", mat_setup, uv_data, obj, mesh, builder) from exc
 			find_obj_time = time.perf_counter() - find_obj_start
@@ -1209,9 +1742,65 @@ class KawaMeshCombiner:
 			)
 		return builders
 	
-	def atlas_islands_to_mathutils_boxes(self, builders: 'IslandsBuilders', original_materials: 'OriginalMaterialSetups') -> 'MathUtilsBoxes':
-		# Преобразует острава в боксы в формате mathutils.geometry.box_pack_2d
-		mathutils_boxes = list()  # type: MathUtilsBoxes
+	def atlas_find_islands_parallel(self, proc_objects: 'Iterable[ProcessingObjectSetup]') -> 'IslandsBuilders':
+		# То же, что atlas_find_islands, но каждый материал обрабатывается в отдельном процессе.
+		# Здесь только читаются массивы, сами острова ищет atlas_kernels.find_islands без bpy.
+		by_material = dict()  # type: Dict[bpy.types.Material, List[ProcessingObjectSetup]]
+		for pobj_setup in proc_objects:
+			by_material.setdefault(pobj_setup.get_material_bpy(), list()).append(pobj_setup)
+		
+		jobs = list()  # type: List[Tuple[OriginalMaterialSetup, List[ProcessingObjectSetup], IslandsJob]]
+		for mat, pobj_setups in by_material.items():
+			mat_setup = self.get_original_material_setup(mat)
+			job = IslandsJob(
+				mat_setup.get_atlas_islands_mode(), mat_setup.get_atlas_single_island(),
+				mat_setup.get_atlas_epsilon(), self.atlas_islands_cell_size(mat_setup)
+			)
+			for pobj_setup in pobj_setups:
+				mesh = get_mesh_safe(pobj_setup.object)
+				loop_uvs, loop_starts, loop_totals = self.atlas_read_uv_arrays(mesh, mat_setup)
+				loop_vertices, order = None, None
+				if job.single_island:
+					pass
+				elif job.mode == 'CONNECTED':
+					loop_vertices = foreach_get_array(mesh.loops, 'vertex_index', numpy.int32)
+				elif job.mode == 'BBOX':
+					order = uv_areas_order(loop_uvs, loop_starts, loop_totals)
+				job.add_object(loop_uvs, loop_starts, loop_totals, loop_vertices=loop_vertices, order=order)
+			jobs.append((mat_setup, pobj_setups, job))
+		# Большие материалы первыми, что бы меньше ждать последний процесс
+		jobs.sort(key=lambda entry: entry[2].get_loops_count(), reverse=True)
+		
+		log.info("Looking for islands of %d materials in %d processes...", len(jobs), self.atlas_islands_workers)
+		builders = dict()  # type: IslandsBuilders
+		find_start = time.perf_counter()
+		with make_process_pool(self.atlas_islands_workers) as pool:
+			futures = list(pool.submit(find_islands, job) for _, _, job in jobs)
+			for (mat_setup, pobj_setups, job), future in zip(jobs, futures):
+				try:
+					raw_islands = future.result()
+					builder = IslandsBuilder(cell_size=job.cell_size)
+					pobj_polygons = list(list(get_mesh_safe(pobj_setup.object).polygons) for pobj_setup in pobj_setups)
+					for mnx, mny, mxx, mxy, raw_per_ob in raw_islands:
+						per_ob = dict()  # type: AttachmentPerObjects
+						for ob_index, poly_indices in raw_per_ob:
+							obj = pobj_setups[ob_index].object
+							polygons = pobj_polygons[ob_index]
+							per_ob[obj] = AttachmentPerObject(obj, get_mesh_safe(obj), list(polygons[i] for i in poly_indices))
+						builder.insert_bbox(Island(
+							mathutils.Vector((mnx, mny)), mathutils.Vector((mxx, mxy)), AttachmentPerMaterial(mat_setup, per_ob)
+						))
+					builders[mat_setup.material] = builder
+				except Exception as exc:
+					raise RuntimeError("Error searching islands in process pool!", mat_setup) from exc
+		find_time = time.perf_counter() - find_start
+		log.info("Processed islands of %d materials for %f sec.", len(jobs), find_time)
+		return builders
+	
+	def atlas_islands_to_box_table(self, builders: 'IslandsBuilders', original_materials: 'OriginalMaterialSetups') -> 'BoxTable':
+		# Преобразует острава в таблицу боксов для упаковки
+		pack, source, attachment = list(), list(), list()  # type: List[Box], List[Box], List[int]
+		attachments = list()  # type: List[AttachmentPerMaterial]
 		aspect_target = 1.0 * self.atlas_size[0] / self.atlas_size[1]
 		for mat_name, bboxes in builders.items():
 			mat_setup = original_materials[mat_name]
@@ -1231,119 +1820,600 @@ class KawaMeshCombiner:
 				bw, bh = w * mat_scale, h * mat_scale
 				# Для целевого квадарата - корректировка аспекта
 				bx, bw = bx / aspect_target, bw / aspect_target
-				mathutils_boxes.append([
-					bx, by, bw, bh,  # 0:X, 1:Y, 2:W, 3:H - Перобразуемые box_pack_2d (далее) координаты
-					x, y, w, h,  # 4:X, 5:Y, 6:W, 7:H - Исходные координаты
-					bx, by, bw, bh,  # 8:X, 9:Y, 10:W, 11:H - Перобразованные (далее) координаты, лучный вариант
-					bbox.attachment,  # 12
-				])
-		return mathutils_boxes
+				pack.append((bx, by, bw, bh))
+				source.append((x, y, w, h))
+				attachment.append(len(attachments))
+				attachments.append(bbox.attachment)
+		return BoxTable.from_rows(pack, source, attachment, attachments)
+	
+	def atlas_pack_alt_sizes(self, table: 'BoxTable') -> 'Optional[List[Tuple[float, float]]]':
+		# Размеры боксов, повёрнутых на 90°, или None, если поворот не разрешён.
+		if not self.atlas_allow_rotation:
+			return None
+		return table.get_alt_sizes(1.0 * self.atlas_size[0] / self.atlas_size[1])
+	
+	def atlas_split_pages(self, table: 'BoxTable') -> 'List[BoxTable]':
+		# Распределяет боксы по страницам атласа так, что бы на каждой странице плотность
+		# была не меньше atlas_min_density. Материал целиком попадает на одну страницу,
+		# т.к. у обрабатываемого объекта один материал. Страницы заполняются по первому подходящему (first-fit),
+		# материалы - от больших к меньшим, вместимость оценивается тем же упаковщиком, что и в atlas_pack_page
+		# (см. atlas_estimate_score), так что после упаковки плотность страницы не меньше оценки.
+		# Назначенная страница записывается в OriginalMaterialSetup.atlas_page.
+		if self.atlas_min_density <= 0 or len(table) == 0:
+			return [table]
+		# Боксы в единицах исходных пикселей, по Y без коррекции аспекта, поэтому плотность = atlas_size[1] / score
+		max_score = self.atlas_size[1] / float(self.atlas_min_density)
+		per_material = dict()  # type: Dict[OriginalMaterialSetup, List[int]]
+		for row in range(len(table)):
+			per_material.setdefault(table.get_attachment(row).material, list()).append(row)
+		areas = table.pack[:, 2] * table.pack[:, 3]
+		
+		def get_area(rows: 'List[int]') -> 'float':
+			return float(numpy.sum(areas[rows]))
+		
+		def get_score(rows: 'List[int]') -> 'float':
+			return self.atlas_estimate_score(table.take(rows))
+		
+		groups = sorted(per_material.items(), key=lambda item: -get_area(item[1]))
+		pages = list()  # type: List[List[int]]
+		for mat_setup, rows in groups:
+			page = None
+			for index in range(len(pages)):
+				if get_area(pages[index]) + get_area(rows) > max_score * max_score:
+					continue  # Не влезет даже при идеальной упаковке
+				if get_score(pages[index] + rows) <= max_score:
+					page = index
+					break
+			if page is None and 0 < self.atlas_max_pages <= len(pages):
+				page = min(range(len(pages)), key=lambda i: get_area(pages[i]))
+				log.warning(
+					"Material='%s' does not fit into %d atlas pages with density %f, putting it on page %d anyway.",
+					mat_setup.material.name, self.atlas_max_pages, self.atlas_min_density, page
+				)
+			if page is None:
+				page = len(pages)
+				pages.append(list())
+				if get_score(rows) > max_score:
+					log.warning(
+						"Material='%s' alone does not fit into atlas page with density %f, it will be shrunk.",
+						mat_setup.material.name, self.atlas_min_density
+					)
+			pages[page].extend(rows)
+			mat_setup.atlas_page = page
+		for index, rows in enumerate(pages):
+			score = get_score(rows)
+			log.info(
+				"Atlas page %d: materials=%s islands=%d estimated density=%f", index,
+				list(mat_setup.material.name for mat_setup, _ in groups if mat_setup.atlas_page == index),
+				len(rows), self.atlas_size[1] / score if score > 0 else 0.0
+			)
+		return list(table.take(rows) for rows in pages)
+	
+	def atlas_estimate_score(self, table: 'BoxTable') -> 'float':
+		# Оценка score (большей стороны упаковки) для atlas_split_pages тем же упаковщиком, что и atlas_pack_page.
+		# Оценка не меньше итоговой: SKYLINE с испытаниями начинает с тех же вариантов pack_boxes,
+		# а atlas_pack_islands берёт лучший из повторов box_pack_2d, первый из которых - эта оценка.
+		if self.atlas_packer == 'SKYLINE':
+			return pack_boxes(table.get_sizes(), alt_sizes=self.atlas_pack_alt_sizes(table)).get_score()
+		pack_x, pack_y = mathutils.geometry.box_pack_2d(table.to_box_pack_2d())
+		return max(pack_x, pack_y)
+	
+	def atlas_pack_page(self, table: 'BoxTable') -> 'BoxTable':
+		# Упаковка одной страницы атласа выбранным упаковщиком
+		if self.atlas_packer == 'SKYLINE' and self.atlas_pack_time > 0:
+			return self.atlas_pack_islands_trials(table)
+		elif self.atlas_packer == 'SKYLINE':
+			return self.atlas_pack_islands_skyline(table)
+		else:
+			return self.atlas_pack_islands(table)
 	
 	@staticmethod
-	def atlas_pack_islands(mathutils_boxes: 'MathUtilsBoxes') -> 'MathUtilsBoxes':
+	def atlas_pack_islands(table: 'BoxTable') -> 'BoxTable':
 		# Несколько итераций перепаковки
+		mathutils_boxes = table.to_box_pack_2d()
 		pack_x, pack_y = mathutils.geometry.box_pack_2d(mathutils_boxes)
 		pack_mx = max(pack_x, pack_y)
-		print("Base repacking score: ", pack_mx)
-		for mu_box in mathutils_boxes:
-			mu_box[8:12] = mu_box[0:4]
+		log.info("Base repacking score: %f", pack_mx)
+		best = numpy.array(mathutils_boxes, dtype=numpy.float64)
 		bad_line, bad_max = 0, 10
 		score_first, score_last, score_new = pack_mx, pack_mx, pack_mx
 		while bad_line < bad_max:
 			px, py = mathutils.geometry.box_pack_2d(mathutils_boxes)
 			score_new = max(px, py)
-			print("Trying repacking score: ", score_new)
+			log.debug("Trying repacking score: %f", score_new)
 			if score_new < score_last:
-				for mu_box in mathutils_boxes:
-					mu_box[8:12] = mu_box[0:4]
-					score_last = score_new
-					bad_line = 0
+				best = numpy.array(mathutils_boxes, dtype=numpy.float64)
+				score_last = score_new
+				bad_line = 0
 			else:
 				bad_line += 1
-		for mu_box in mathutils_boxes:
-			# Преобразование целевых координат в 0..1
-			mu_box[8], mu_box[9] = mu_box[8] / score_last, mu_box[9] / score_last
-			mu_box[10], mu_box[11] = mu_box[10] / score_last, mu_box[11] / score_last
-		return mathutils_boxes
+		table.from_box_pack_2d(best)
+		log.info(
+			"Packed %d islands with box_pack_2d: score=%f fill=%.2f%%", len(table), score_last, table.get_fill(score_last) * 100
+		)
+		table.normalize(score_last)
+		return table
+	
+	def atlas_pack_islands_skyline(self, table: 'BoxTable') -> 'BoxTable':
+		# Одна детерминированная упаковка atlas_kernels.pack_boxes вместо повторов box_pack_2d
+		pack_start = time.perf_counter()
+		alt_sizes = self.atlas_pack_alt_sizes(table)
+		result = pack_boxes(table.get_sizes(), alt_sizes=alt_sizes)
+		log.info(
+			"Packed %d islands with skyline (%s): score=%f fill=%.2f%% rotated=%d for %f sec.",
+			len(table), result.heuristic, result.get_score(), result.fill * 100, sum(result.rotated),
+			time.perf_counter() - pack_start
+		)
+		table.apply_pack_result(result, alt_sizes)
+		return table
+	
+	def atlas_pack_islands_trials(self, table: 'BoxTable') -> 'BoxTable':
+		# Испытания упаковки (atlas_kernels.pack_trial) до исчерпания atlas_pack_time секунд, остаётся лучшее.
+		# Если задан atlas_pack_workers, испытания идут пачками в пуле процессов.
+		# Начальный результат - pack_boxes (он же все детерминированные испытания), так что испытания могут только
+		# улучшить его, и оценка atlas_estimate_score для страниц атласа остаётся верной при любом бюджете.
+		sizes = table.get_sizes()
+		if len(sizes) == 0:
+			return table
+		alt_sizes = self.atlas_pack_alt_sizes(table)
+		pack_start = time.perf_counter()
+		deadline = pack_start + self.atlas_pack_time
+		per_task = self.PACK_TRIALS_PER_TASK
+		best = pack_boxes(sizes, alt_sizes=alt_sizes)  # type: PackResult
+		trials = len(PACK_HEURISTICS) * len(PACK_WIDTH_FACTORS)
+		
+		def is_better(result: 'Optional[PackResult]') -> 'bool':
+			return result is not None and result.get_score() < best.get_score()
+		
+		if self.atlas_pack_workers > 0:
+			with make_process_pool(self.atlas_pack_workers) as pool:
+				pending = set()
+				# Задач в очереди вдвое больше процессов, что бы процессы не простаивали
+				while len(pending) < 2 * self.atlas_pack_workers:
+					pending.add(pool.submit(pack_trials, sizes, range(trials, trials + per_task), alt_sizes))
+					trials += per_task
+				while len(pending) > 0:
+					done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+					for future in done:
+						result = future.result()
+						if is_better(result):
+							best = result
+						if time.perf_counter() < deadline:
+							pending.add(pool.submit(pack_trials, sizes, range(trials, trials + per_task), alt_sizes))
+							trials += per_task
+		else:
+			while time.perf_counter() < deadline:
+				result = pack_trials(sizes, range(trials, trials + per_task), alt_sizes)
+				trials += per_task
+				if is_better(result):
+					best = result
+		log.info(
+			"Packed %d islands with %d skyline trials (best %s): score=%f fill=%.2f%% rotated=%d for %f sec.",
+			len(table), trials, best.heuristic, best.get_score(), best.fill * 100, sum(best.rotated),
+			time.perf_counter() - pack_start
+		)
+		table.apply_pack_result(best, alt_sizes)
+		return table
 	
 	@staticmethod
-	def atlas_mathutils_boxes_to_transforms(mathutils_boxes: 'MathUtilsBoxes') -> 'List[UVBoxTransform]':
+	def atlas_box_table_params(table: 'BoxTable') -> 'numpy.ndarray':
+		# Параметры преобразований UV для всех боксов таблицы, исходные координаты переводятся в 0..1
+		attachment_sizes = numpy.array(
+			list(attachment.material.get_original_size() for attachment in table.attachments), dtype=numpy.float64
+		).reshape(-1, 2)
+		return table.get_transform_params(attachment_sizes[table.attachment])
+	
+	@staticmethod
+	def atlas_box_table_to_transforms(table: 'BoxTable') -> 'List[UVBoxTransform]':
+		# Отдельные объекты UVBoxTransform, для отладки и поштучного применения
 		transforms = list()  # type: List[UVBoxTransform]
-		for mu_box in mathutils_boxes:
-			attachment = mu_box[12]
-			mat_size = attachment.material.get_original_size()
+		params = KawaMeshCombiner.atlas_box_table_params(table)
+		for row in range(len(table)):
+			ax, ay, aw, ah, bx, by, bw, bh, rotated = params[row].tolist()
+			transforms.append(UVBoxTransform(ax, ay, aw, ah, bx, by, bw, bh, table.get_attachment(row), rotated=rotated != 0))
+		return transforms
+	
+	@staticmethod
+	def atlas_apply_box_table(table: 'BoxTable') -> 'int':
+		# Применение преобразований всех боксов таблицы сразу, см. apply_uv_transforms
+		attachments = list(table.get_attachment(row) for row in range(len(table)))
+		return apply_uv_transforms(attachments, KawaMeshCombiner.atlas_box_table_params(table))
+	
+	def atlas_bake(self, proc_objects: 'Iterable[ProcessingObjectSetup]', pages: 'Optional[List[BoxTable]]' = None):
+		# Каждая страница атласа запекается отдельно, только из объектов с материалами этой страницы.
+		# pages - упакованные таблицы боксов по страницам, нужны для atlas_bake_mode='BLIT'.
+		per_page = dict()  # type: Dict[int, List[ProcessingObjectSetup]]
+		for pobj_setup in proc_objects:
+			omat_setup = self.original_materials[pobj_setup.get_material_bpy()]
+			per_page.setdefault(omat_setup.atlas_page, list()).append(pobj_setup)
+		for page in sorted(per_page.keys()):
+			table = pages[page] if pages is not None else None
+			self.atlas_bake_page(page, per_page[page], table)
+	
+	def atlas_bake_page(self, page: 'int', proc_objects: 'List[ProcessingObjectSetup]', table: 'Optional[BoxTable]' = None):
+		cache = self.get_bake_cache() if table is not None else None
+		render_setups = list()  # type: List[AtlasTextureSetup]
+		for atex_type, atex_setup in self.prepare_all_atlas_textures(page).items():
+			if self.bake_dilation > 0 and table is not None:
+				atex_setup.bake_margin = self.get_dilation_bake_margin(atex_setup, table)
+			if self.atlas_bake_mode == 'BLIT' and table is not None and atex_setup.type in self.BLIT_TEXTURE_TYPES:
+				self.atlas_blit_texture(atex_setup, table)
+				continue
+			if self.atlas_bake_mode == 'BLIT':
+				log.warning("Texture type='%s' can not be blitted, baking it with render.", atex_setup.type)
+			render_setups.append(atex_setup)
+		if self.atlas_bake_workers > 0 and cache is None and len(render_setups) > 0:
+			self.atlas_bake_parallel(render_setups, proc_objects, table)
+		else:
+			for atex_setup in render_setups:
+				log.info("Preparing to bake atlas page=%d type='%s'...", page, atex_setup.type)
+				if cache is not None:
+					self.atlas_bake_cached(atex_setup, proc_objects, table, cache)
+				elif table is not None and len(table) > 0:
+					aa_levels = self.get_islands_bake_aa(atex_setup, table)
+					if len(set(aa_levels)) > 1:
+						self.atlas_render_islands(atex_setup, proc_objects, table, list(range(len(table))), aa_levels)
+					else:
+						# Одно сглаживание на все острова - один обычный проход, без чтения пикселей атласа обратно
+						self.atlas_render_texture(atex_setup, proc_objects, aa=aa_levels[0])
+				else:
+					self.atlas_render_texture(atex_setup, proc_objects)
+		if self.bake_dilation > 0 and table is not None:
+			for atex_setup in self.prepare_all_atlas_textures(page).values():
+				self.atlas_dilate_texture(atex_setup, table)
+		if cache is not None:
+			removed = cache.prune(self.BAKE_CACHE_MAX_BYTES)
+			log.info("Bake cache: %d hits, %d misses, %d old tiles removed.", cache.hits, cache.misses, removed)
+	
+	def get_dilation_bake_margin(self, atex_setup: 'AtlasTextureSetup', table: 'BoxTable') -> 'int':
+		# bake_margin при bake_dilation > 0: маска atlas_dilate_texture - целые боксы вместе с полями atlas_padding,
+		# по этому рендер должен закрыть поля целиком, иначе dilate расширит цвет очистки, а не края островов.
+		# Поле в пикселях атласа - atlas_padding исходных пикселей, умноженный на масштаб бокса (с учётом поворота).
+		if len(table) == 0 or self.atlas_padding <= 0:
+			return self.BAKE_DILATION_MARGIN
+		size = numpy.array(atex_setup.get_size(), dtype=numpy.float64)
+		source_sizes = numpy.where(table.rotated[:, None], table.source[:, 3:1:-1], table.source[:, 2:4])
+		scales = table.target[:, 2:4] * size / numpy.where(source_sizes > 0, source_sizes, 1.0)
+		padding = float(numpy.max(scales)) * self.atlas_padding
+		return max(self.BAKE_DILATION_MARGIN, int(math.ceil(padding)) + 1)
+	
+	def atlas_dilate_texture(self, atex_setup: 'AtlasTextureSetup', table: 'BoxTable'):
+		# Расширение краёв островов на bake_dilation пикселей по маске целевых боксов (atlas_kernels.dilate),
+		# вместо большого bake_margin при запекании. Заодно даёт поля островам из BLIT и кеша тайлов.
+		dilate_start = time.perf_counter()
+		atex_image = atex_setup.prepare_image()
+		size = atex_setup.get_size()
+		mask = boxes_mask(table.target, size[0], size[1])
+		pixels = dilate(to_rgba(image_pixels_get(atex_image)), mask, self.bake_dilation)
+		image_pixels_set(atex_image, pixels)
+		log.info(
+			"Dilated atlas Texture='%s' type='%s' by %d pixels, time spent: %f sec.",
+			atex_image.name, atex_setup.type, self.bake_dilation, time.perf_counter() - dilate_start
+		)
+	
+	def get_default_bake_aa(self) -> 'str':
+		# Сглаживание запекания, если его не задают материалы: bake_aa (кроме AUTO) или как раньше по fast_mode
+		if self.fast_mode:
+			return '5'
+		return self.bake_aa if self.bake_aa is not None and self.bake_aa != 'AUTO' else '16'
+	
+	def get_islands_bake_aa(self, atex_setup: 'AtlasTextureSetup', table: 'BoxTable') -> 'List[str]':
+		# Сглаживание для каждого острова таблицы: bake_aa материала, а для AUTO - по итоговому масштабу острова:
+		# сколько пикселей атласа приходится на пиксель исходной текстуры (с учётом atlas_scale).
+		# Увеличенным и скопированным 1:1 островам много сэмплов не нужно, уменьшенным - тем больше, чем сильнее уменьшение.
+		size = atex_setup.get_size()
+		target_area = table.target[:, 2] * size[0] * table.target[:, 3] * size[1]
+		source_area = table.source[:, 2] * table.source[:, 3]
+		ratios = numpy.sqrt(target_area / numpy.where(source_area > 0, source_area, 1.0)).tolist()
+		result = list()  # type: List[str]
+		for row in range(len(table)):
+			aa = table.get_attachment(row).material.get_bake_aa()
+			if aa == 'AUTO':
+				aa = '16'
+				for min_ratio, level in self.BAKE_AA_AUTO_LEVELS:
+					if ratios[row] >= min_ratio:
+						aa = level
+						break
+			result.append(aa)
+		return result
+	
+	def get_bake_settings(self, atex_setup: 'AtlasTextureSetup', clear: 'bool' = True, aa: 'Optional[str]' = None) -> 'Dict[str, Any]':
+		# Настройки scene.render для запекания текстуры, общие для запекания здесь и в фоновых процессах
+		if aa is None:
+			aa = self.get_default_bake_aa()
+		if self.bake_dilation > 0:
+			# Края островов потом расширяет atlas_dilate_texture, рендеру нужно только закрыть поля внутри боксов
+			bake_margin = any_not_none(atex_setup.bake_margin, self.BAKE_DILATION_MARGIN)
+		else:
+			bake_margin = 64 if not self.fast_mode else 2
+		return {
+			'bake_type': atex_setup.type,
+			'bake_margin': bake_margin,
+			'bake_aa_mode': aa,
+			'use_bake_clear': clear,
+			'antialiasing_samples': aa,
+		}
+	
+	def atlas_bake_parallel(
+			self, atex_setups: 'List[AtlasTextureSetup]', proc_objects: 'List[ProcessingObjectSetup]', table: 'Optional[BoxTable]' = None
+	):
+		# Запекание каждой текстуры в отдельном фоновом процессе blender -b (не больше atlas_bake_workers сразу):
+		# подготовленная сцена сохраняется во временный .blend, процесс (bake_worker.py) запекает свою картинку в PNG,
+		# после чего пиксели загружаются обратно в картинки атласа этого процесса.
+		# Процесс запекает текстуру за один проход, со сглаживанием, наибольшим среди островов.
+		bake_start = time.perf_counter()
+		temp_dir = tempfile.mkdtemp(prefix='kawa_bake_')
+		try:
+			for atex_setup in atex_setups:
+				atex_setup.prepare_image()
+			blend_path = os.path.join(temp_dir, 'bake.blend')
+			ensure_op_finished(
+				bpy.ops.wm.save_as_mainfile(filepath=blend_path, copy=True, compress=False), name='bpy.ops.wm.save_as_mainfile'
+			)
+			worker_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bake_worker.py')
+			object_names = list(pobj_setup.object.name for pobj_setup in proc_objects)
 			
-			#  Преобразование исходных координат в 0..1
-			ax, aw = mu_box[4] / mat_size[0], mu_box[6] / mat_size[0]
-			ay, ah = mu_box[5] / mat_size[1], mu_box[7] / mat_size[1]
+			def get_max_aa(atex_setup: 'AtlasTextureSetup') -> 'Optional[str]':
+				if table is None or len(table) == 0:
+					return None
+				return max(self.get_islands_bake_aa(atex_setup, table), key=int)
 			
-			transforms.append(UVBoxTransform(
-				ax, ay, aw, ah, mu_box[8], mu_box[9], mu_box[10], mu_box[11], attachment
-			))
-		return transforms
+			def bake_worker(atex_setup: 'AtlasTextureSetup') -> 'str':
+				output = os.path.join(temp_dir, atex_setup.type + '.png')
+				args = {
+					'image': atex_setup.image.name, 'objects': object_names, 'output': output,
+					'target_uv': self.PROC_TARGET_ATLAS_UV_NAME, 'original_uv': self.PROC_ORIGINAL_ATLAS_UV_NAME,
+					'settings': self.get_bake_settings(atex_setup, aa=get_max_aa(atex_setup)),
+				}
+				command = [
+					bpy.app.binary_path, '-b', blend_path, '--python-exit-code', '1', '--python', worker_path, '--', json.dumps(args)
+				]
+				log.info("Starting background bake of atlas Texture='%s' type='%s'...", atex_setup.image.name, atex_setup.type)
+				process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+				if process.returncode != 0 or not os.path.isfile(output):
+					raise RuntimeError(
+						"Background bake failed!", atex_setup.type, process.returncode, process.stdout.decode('utf-8', 'replace')
+					)
+				return output
+			
+			with concurrent.futures.ThreadPoolExecutor(max_workers=self.atlas_bake_workers) as pool:
+				outputs = list(pool.map(bake_worker, atex_setups))
+			for atex_setup, output in zip(atex_setups, outputs):
+				baked = bpy.data.images.load(output)
+				try:
+					image_pixels_set(atex_setup.image, to_rgba(image_pixels_get(baked)))
+				finally:
+					bpy.data.images.remove(baked)
+				log.info("Loaded background baked atlas Texture='%s' type='%s'.", atex_setup.image.name, atex_setup.type)
+		finally:
+			shutil.rmtree(temp_dir, ignore_errors=True)
+		log.info(
+			"Baked %d atlas textures in background processes, time spent: %f sec.", len(atex_setups), time.perf_counter() - bake_start
+		)
 	
-	def atlas_bake(self, proc_objects: 'Iterable[ProcessingObjectSetup]'):
-		for atex_type, atex_setup in self.prepare_all_atlas_textures().items():
-			log.info("Preparing to bake atlas type='%s'...", atex_setup.type)
-			ensure_deselect_all()
-			atex_image = atex_setup.prepare_image()
-			polys_assigns = 0
-			for pobj_setup in proc_objects:
-				pobj_setup.object.select = True
-				pobj_setup.object.hide = False
-				pobj_setup.object.hide_render = False
-				# bpy.context.scene.objects.active = pobj_setup.object
-				for layer in get_mesh_safe(pobj_setup.object).uv_textures:  # type: bpy.types.MeshTexturePolyLayer
-					layer.active = layer.name == self.PROC_TARGET_ATLAS_UV_NAME
-					layer.active_render = layer.name == self.PROC_ORIGINAL_ATLAS_UV_NAME
-					layer.active_clone = False
-					if layer.active:
-						for data in layer.data:  # type: bpy.types.MeshTexturePoly
+	def atlas_render_texture(
+			self, atex_setup: 'AtlasTextureSetup', proc_objects: 'List[ProcessingObjectSetup]',
+			only_polys: 'Optional[Dict[bpy.types.Object, Set[int]]]' = None, clear: 'Optional[bool]' = None,
+			aa: 'Optional[str]' = None
+	):
+		# Запекание текстуры атласа рендером. Если задан only_polys, то картинка назначается только этим полигонам
+		# (остальные не запекаются), и по умолчанию содержимое картинки не очищается перед запеканием.
+		# aa - сглаживание (bake_aa_mode и antialiasing_samples), по умолчанию get_default_bake_aa().
+		if clear is None:
+			clear = only_polys is None
+		self.selection.deselect_all()
+		atex_image = atex_setup.prepare_image()
+		polys_assigns = 0
+		for pobj_setup in proc_objects:
+			self.selection.select(pobj_setup.object)
+			pobj_setup.object.hide = False
+			pobj_setup.object.hide_render = False
+			only = only_polys.get(pobj_setup.object, set()) if only_polys is not None else None
+			# bpy.context.scene.objects.active = pobj_setup.object
+			for layer in get_mesh_safe(pobj_setup.object).uv_textures:  # type: bpy.types.MeshTexturePolyLayer
+				layer.active = layer.name == self.PROC_TARGET_ATLAS_UV_NAME
+				layer.active_render = layer.name == self.PROC_ORIGINAL_ATLAS_UV_NAME
+				layer.active_clone = False
+				if layer.active:
+					for index, data in enumerate(layer.data):  # type: bpy.types.MeshTexturePoly
+						if only is None or index in only:
 							data.image = atex_image
 							polys_assigns += 1
-			bpy.context.scene.render.bake_type = atex_setup.type
-			bpy.context.scene.render.bake_margin = 64 if not self.fast_mode else 2
-			bpy.context.scene.render.bake_aa_mode = '16' if not self.fast_mode else '5'
-			bpy.context.scene.render.use_bake_clear = True
-			bpy.context.scene.render.antialiasing_samples = '16' if not self.fast_mode else '5'
-			log.info("Trying to bake atlas Texture='%s' type='%s' from %d polygons...", atex_image.name, atex_setup.type, polys_assigns)
-			bake_start = time.perf_counter()
-			ensure_op_finished(bpy.ops.object.bake_image())
-			bake_time = time.perf_counter() - bake_start
-			log.info("Baked atlas Texture='%s' type='%s', time spent: %f sec.", atex_image.name, atex_setup.type, bake_time)
+						else:
+							data.image = None
+		# Запекание идёт по целевой UV, поэтому повёрнутые острова (UVBoxTransform.rotated) отдельно не обрабатываются
+		settings = self.get_bake_settings(atex_setup, clear=clear, aa=aa)
+		for key, value in settings.items():
+			setattr(bpy.context.scene.render, key, value)
+		log.info(
+			"Trying to bake atlas Texture='%s' type='%s' aa=%s from %d polygons...",
+			atex_image.name, atex_setup.type, settings['bake_aa_mode'], polys_assigns
+		)
+		bake_start = time.perf_counter()
+		ensure_op_finished(bpy.ops.object.bake_image())
+		bake_time = time.perf_counter() - bake_start
+		log.info("Baked atlas Texture='%s' type='%s', time spent: %f sec.", atex_image.name, atex_setup.type, bake_time)
 	
-	@classmethod
-	def combine_proc_objects(cls, proc_objects: 'Iterable[ProcessingObjectSetup]') -> 'Set[bpy.types.Object]':
-		targets = set()
+	@staticmethod
+	def atlas_rows_polys(table: 'BoxTable', rows: 'Iterable[int]') -> 'Dict[bpy.types.Object, Set[int]]':
+		# Индексы полигонов островов rows по объектам, для atlas_render_texture(only_polys=...)
+		only_polys = dict()  # type: Dict[bpy.types.Object, Set[int]]
+		for row in rows:
+			for per_ob in table.get_attachment(row).per_ob.values():
+				only_polys.setdefault(per_ob.object, set()).update(poly.index for poly in per_ob.polys)
+		return only_polys
+	
+	def atlas_render_islands(
+			self, atex_setup: 'AtlasTextureSetup', proc_objects: 'List[ProcessingObjectSetup]', table: 'BoxTable',
+			rows: 'List[int]', aa_levels: 'List[str]', atlas: 'Optional[numpy.ndarray]' = None
+	) -> 'Optional[numpy.ndarray]':
+		# Запекание островов rows отдельными проходами, по проходу на каждое сглаживание aa_levels[row].
+		# Если задан atlas, он сначала пишется в картинку, и она не очищается (готовые пиксели, например, из кеша),
+		# иначе первый проход очищает картинку. Прямоугольники островов каждого прохода запоминаются
+		# и в конце возвращаются на место, т.к. bake_margin следующих проходов мог залезть на них.
+		# Возвращает пиксели атласа, но только если задан atlas или проходов несколько: иначе картинка
+		# обратно не читается (на 2.79 это pixels[:] в список на десятки миллионов float) и возвращается None.
+		atex_image = atex_setup.prepare_image()
+		size = atex_setup.get_size()
+		if len(rows) == 0:
+			return atlas
+		rects = pixel_rects(table.target, size[0], size[1]).tolist()
+		passes = dict()  # type: Dict[str, List[int]]
+		for row in rows:
+			passes.setdefault(aa_levels[row], list()).append(row)
+		if atlas is not None:
+			image_pixels_set(atex_image, atlas)
+		clear = atlas is None
+		whole = clear and len(passes) == 1 and len(rows) == len(table)
+		read_back = atlas is not None or len(passes) > 1
+		tiles = dict()  # type: Dict[int, numpy.ndarray]
+		pixels = atlas
+		for aa in sorted(passes.keys(), key=int):
+			pass_rows = passes[aa]
+			log.info("Baking %d islands of atlas Texture='%s' with aa=%s...", len(pass_rows), atex_image.name, aa)
+			only_polys = None if whole else self.atlas_rows_polys(table, pass_rows)
+			self.atlas_render_texture(atex_setup, proc_objects, only_polys, clear=clear, aa=aa)
+			clear = False
+			if not read_back:
+				continue
+			pixels = to_rgba(image_pixels_get(atex_image))
+			if len(passes) > 1:
+				for row in pass_rows:
+					x0, y0, x1, y1 = rects[row]
+					tiles[row] = pixels[y0:y1, x0:x1].copy()
+		if len(tiles) > 0:
+			for row, tile in tiles.items():
+				x0, y0, x1, y1 = rects[row]
+				pixels[y0:y1, x0:x1] = tile
+			image_pixels_set(atex_image, pixels)
+		return pixels
+	
+	def get_bake_cache(self) -> 'Optional[TileCache]':
+		# Кеш тайлов рядом с .blend файлом, если он включен и файл сохранён
+		if not self.atlas_bake_cache:
+			return None
+		blend_path = bpy.data.filepath
+		if not blend_path:
+			log.warning("%s is set, but .blend file is not saved, baking without cache.", self.L_ATLAS_BAKE_CACHE)
+			return None
+		directory = os.path.splitext(blend_path)[0] + self.BAKE_CACHE_SUFFIX
+		return TileCache(directory)
+	
+	def atlas_tile_keys(self, atex_setup: 'AtlasTextureSetup', table: 'BoxTable', aa_levels: 'List[str]') -> 'List[str]':
+		# Ключи тайлов островов: тип текстуры, настройки запекания и сглаживание острова,
+		# содержимое картинок и настройки материала, исходные UV полигонов и исходный прямоугольник острова,
+		# размер тайла в пикселях атласа и поворот. Положение острова в атласе в ключ не входит:
+		# при другой раскладке тайл того же размера берётся из кеша и кладётся на новое место (см. atlas_bake_cached),
+		# расхождение с новым запеканием - только сдвиг меньше пикселя.
+		attachments = list(table.get_attachment(row) for row in range(len(table)))
+		uv_hashes = island_uv_hashes(attachments)
+		size = atex_setup.get_size()
+		rects = pixel_rects(table.target, size[0], size[1])
+		tile_sizes = (rects[:, 2:4] - rects[:, 0:2]).tolist()
+		return list(
+			tile_key(
+				atex_setup.type, self.fast_mode, self.bake_dilation, aa_levels[row],
+				attachments[row].material.get_bake_hash(), uv_hashes[row],
+				table.source[row], tuple(tile_sizes[row]), bool(table.rotated[row])
+			) for row in range(len(table))
+		)
+	
+	def atlas_bake_cached(
+			self, atex_setup: 'AtlasTextureSetup', proc_objects: 'List[ProcessingObjectSetup]', table: 'BoxTable', cache: 'TileCache'
+	):
+		# Запекание с кешем тайлов: тайлы не изменившихся островов берутся из кеша и собираются в атлас
+		# по текущим целевым прямоугольникам, даже если раскладка атласа поменялась,
+		# рендером запекаются только полигоны островов, которых нет в кеше (без очистки картинки).
+		# Тайлы - боксы вместе с полями atlas_padding, поля снаружи боксов потом строит atlas_dilate_texture
+		# (при кеше bake_dilation > 0 всегда, см. from_raw_config), по этому результат совпадает с запеканием без кеша.
+		atex_image = atex_setup.prepare_image()
+		size = atex_setup.get_size()
+		rects = pixel_rects(table.target, size[0], size[1]).tolist()
+		aa_levels = self.get_islands_bake_aa(atex_setup, table)
+		keys = self.atlas_tile_keys(atex_setup, table, aa_levels)
+		atlas = numpy.zeros((size[1], size[0], 4), dtype=numpy.float32)
+		tiles = list()  # type: List[Optional[numpy.ndarray]]
+		for row, (x0, y0, x1, y1) in enumerate(rects):
+			tile = cache.get(keys[row], (y1 - y0, x1 - x0, 4))
+			if tile is not None:
+				atlas[y0:y1, x0:x1] = tile
+			tiles.append(tile)
+		missing = list(row for row, tile in enumerate(tiles) if tile is None)
+		log.info(
+			"Atlas Texture='%s' type='%s': %d islands cached, %d to bake.",
+			atex_image.name, atex_setup.type, len(tiles) - len(missing), len(missing)
+		)
+		if len(missing) > 0:
+			atlas = self.atlas_render_islands(atex_setup, proc_objects, table, missing, aa_levels, atlas)
+			# bake_margin новых островов мог залезть на закешированные
+			for row, (x0, y0, x1, y1) in enumerate(rects):
+				if tiles[row] is not None:
+					atlas[y0:y1, x0:x1] = tiles[row]
+				else:
+					cache.put(keys[row], atlas[y0:y1, x0:x1].copy())
+		image_pixels_set(atex_image, atlas)
+	
+	def atlas_blit_texture(self, atex_setup: 'AtlasTextureSetup', table: 'BoxTable'):
+		# Вместо запекания: пиксели островов переносятся из картинок исходных материалов прямо в атлас
+		# (atlas_kernels.blit_boxes), т.к. преобразование каждого острова - только сдвиг, масштаб и поворот на 90°.
+		# Смешивание слотов, влияние и т.п. не учитываются, только картинка подходящего слота или цвет материала.
+		blit_start = time.perf_counter()
+		atex_image = atex_setup.prepare_image()
+		size = atex_setup.get_size()
+		atlas = numpy.zeros((size[1], size[0], 4), dtype=numpy.float32)
+		params = self.atlas_box_table_params(table)
+		per_material = dict()  # type: Dict[OriginalMaterialSetup, List[int]]
+		for row in range(len(table)):
+			per_material.setdefault(table.get_attachment(row).material, list()).append(row)
+		for omat_setup, rows in per_material.items():
+			blit_boxes(atlas, omat_setup.get_blit_source(atex_setup.type), params[rows])
+		image_pixels_set(atex_image, atlas)
+		log.info(
+			"Blitted atlas Texture='%s' type='%s' from %d islands of %d materials, time spent: %f sec.",
+			atex_image.name, atex_setup.type, len(table), len(per_material), time.perf_counter() - blit_start
+		)
+	
+	def combine_proc_objects(self, proc_objects: 'Iterable[ProcessingObjectSetup]') -> 'Set[bpy.types.Object]':
+		# Все части одной цели присоединяются одним bpy.ops.object.join,
+		# а не по одной, иначе меша цели пересобирается на каждое присоединение
+		pieces = dict()  # type: Dict[bpy.types.Object, List[bpy.types.Object]]
 		for pobj_setup in proc_objects:
-			pobj = pobj_setup.object
 			tobj_name = pobj_setup.get_target_object_name()
 			tobj = bpy.data.objects.get(tobj_name)  # type: bpy.types.Object
-			targets.add(tobj)
-			ensure_deselect_all()
-			pobj.select = True
-			tobj.select = True
-			bpy.context.scene.objects.active = tobj
-			log.info("Combining: %s", str(list(obj.name for obj in bpy.context.selected_objects)))
+			if tobj is None:
+				raise RuntimeError("Target object does not exist!", tobj_name, pobj_setup.object)
+			pieces.setdefault(tobj, list()).append(pobj_setup.object)
+		targets = set(pieces.keys())
+		for tobj, pobjs in pieces.items():
+			self.selection.deselect_all()
+			self.selection.select(*pobjs)
+			self.selection.select(tobj)
+			self.selection.set_active(tobj)
+			log.info("Combining %d objects into Object='%s'...", len(pobjs), tobj.name)
 			ensure_op_finished(bpy.ops.object.join(), name="bpy.ops.object.join")
-		ensure_deselect_all()
+		self.selection.deselect_all()
+		if self.weld_mode == 'KDTREE':
+			for tobj in targets:
+				welded = weld_boundary_verts(get_mesh_safe(tobj), self.WELD_DISTANCE)
+				log.info("Welded %d boundary vertices of Object='%s'", welded, tobj.name)
+			return targets
 		for tobj in targets:
 			try:
 				tobj.hide = False
 				tobj.hide_render = False
 				tobj.hide_select = False
-				tobj.select = True
-				bpy.context.scene.objects.active = tobj
+				self.selection.select(tobj)
+				self.selection.set_active(tobj)
 				ensure_op_finished(bpy.ops.object.mode_set(mode='EDIT'), name="bpy.ops.object.mode_set")
 				bpy.context.tool_settings.mesh_select_mode = (False, True, False)  # Edge selection
 				ensure_op_finished(bpy.ops.mesh.select_all(action='DESELECT'), name="bpy.ops.mesh.select_all")
 				ensure_op_finished(bpy.ops.mesh.select_non_manifold(
 					extend=True, use_wire=False, use_boundary=True, use_multi_face=False, use_non_contiguous=False, use_verts=False
 				), name="bpy.ops.mesh.select_non_manifold")
-				ensure_op_finished(bpy.ops.mesh.remove_doubles(threshold=1e-06), name="bpy.ops.mesh.remove_doubles")
+				ensure_op_finished(bpy.ops.mesh.remove_doubles(threshold=self.WELD_DISTANCE), name="bpy.ops.mesh.remove_doubles")
 			finally:
 				ensure_op_finished(bpy.ops.object.mode_set(mode='OBJECT'), name="bpy.ops.object.mode_set")
-		ensure_deselect_all()
+		self.selection.deselect_all()
 		return targets
 	
 	def rename_proc_uvs(self, target_objects: 'Iterable[bpy.types.Object]'):
@@ -1352,15 +2422,10 @@ class KawaMeshCombiner:
 			try:
 				tmesh = get_mesh_safe(tobj)
 				
-				def should_remove(name, _):
-					if name == self.PROC_ORIGINAL_ATLAS_UV_NAME: return True
-					if name == self.PROC_ORIGINAL_LM_UV_NAME: return True
-					return False
-				
 				def do_remove(name, _):
 					log.info("Removed %s", name)
 				
-				remove_uv_layer_by_condition(tmesh, should_remove, do_remove)
+				remove_uv_layers(tmesh, {self.PROC_ORIGINAL_ATLAS_UV_NAME, self.PROC_ORIGINAL_LM_UV_NAME}, do_remove)
 				
 				uv_atlas_target = tmesh.uv_textures.get(self.PROC_TARGET_ATLAS_UV_NAME)
 				if uv_atlas_target is not None: uv_atlas_target.name = self.get_atlas_target_uv()
@@ -1371,6 +2436,14 @@ class KawaMeshCombiner:
 				raise RuntimeError("Error renaming UV!", tobj, tmesh, uv_atlas_original, uv_atlas_target, uv_lm_original, uv_lm_target) from exc
 	
 	def run(self):
+		# Выделение и активный объект пользователя восстанавливаются в конце, даже если что-то упало
+		self.selection.begin()
+		try:
+			self.run_combine()
+		finally:
+			self.selection.restore()
+	
+	def run_combine(self):
 		print()
 		log.info('Preparing...')
 		
@@ -1408,23 +2481,22 @@ class KawaMeshCombiner:
 				pass
 			
 			log.info('Re-packing UV-Main islands...')
-			mathutils_boxes = self.atlas_islands_to_mathutils_boxes(builders, original_materials)
-			mathutils_boxes = self.atlas_pack_islands(mathutils_boxes)
-			
-			log.info('Preparing UV-Main transforms...')
-			transforms = self.atlas_mathutils_boxes_to_transforms(mathutils_boxes)
-			log.info('Prepared UV-Main transforms: %d', len(transforms))
-			# for tr in self.transforms:
+			box_table = self.atlas_islands_to_box_table(builders, original_materials)
+			pages = self.atlas_split_pages(box_table)
+			for page, page_table in enumerate(pages):
+				if len(pages) > 1:
+					log.info("Re-packing UV-Main islands of atlas page %d...", page)
+				self.atlas_pack_page(page_table)
+			# for tr in self.atlas_box_table_to_transforms(pages[0]):
 			# 	log.info("UVBoxTransform: ", (tr.attachment.material.material.layer_name, str(tr)))
 			
 			log.info('Applying UV-Main transforms...')
-			transformed = 0
-			for transform in transforms:
-				transformed += transform.apply()
-			log.info('Transformed UV loops: %d', transformed)
+			apply_start = time.perf_counter()
+			transformed = sum(self.atlas_apply_box_table(page_table) for page_table in pages)
+			log.info('Transformed UV loops: %d for %f sec.', transformed, time.perf_counter() - apply_start)
 			
 			print('Baking Atlas...')
-			self.atlas_bake(proc_main)
+			self.atlas_bake(proc_main, pages)
 			
 			log.info("Re-assigning materials...")
 			for pobj_setup in proc_main: pobj_setup.reassign_material()
@@ -1448,4 +2520,6 @@ class KawaMeshCombiner:
 			oobj.object.hide_render = True
 			oobj.object.hide_select = False
 		
+		self.remove_garbage_meshes()
+		
 		log.info('Done!')
@@ -0,0 +1,13 @@
+# Kawashirov's Scripts (c) 2019 by Sergey V. Kawashirov
+#
+# Kawashirov's Scripts is licensed under a
+# Creative Commons Attribution-NonCommercial-ShareAlike 3.0 Unported License.
+#
+# You should have received a copy of the license along with this
+# work.  If not, see <http://creativecommons.org/licenses/by-nc-sa/3.0/>.
+#
+#
+
+# Пустой модуль, который commons.make_process_pool подставляет вместо __main__ на время жизни пула процессов.
+# При запуске через spawn дочерний процесс выполняет __main__ родителя заново, а внутри Blender это скрипт --python
+# или текстовый блок. Вместо них дочерний процесс выполнит этот модуль, поэтому здесь ничего не должно быть.
@@ -0,0 +1,102 @@
+# Kawashirov's Scripts (c) 2019 by Sergey V. Kawashirov
+#
+# Kawashirov's Scripts is licensed under a
+# Creative Commons Attribution-NonCommercial-ShareAlike 3.0 Unported License.
+#
+# You should have received a copy of the license along with this
+# work.  If not, see <http://creativecommons.org/licenses/by-nc-sa/3.0/>.
+#
+#
+
+# Тесты atlas_kernels, без bpy: python -m unittest discover tests (или python -m pytest tests)
+
+import random
+import time
+import unittest
+
+import numpy
+
+from kawa_scripts.atlas_kernels import box_intersect, emit_intensity, sweep_merge_boxes
+
+
+def brute_merge_boxes(boxes, epsilon=0.0):
+	# Эталон для sweep_merge_boxes: попарное слияние, пока сливать нечего
+	groups = list([i] for i in range(len(boxes)))
+	merged_boxes = list(boxes)
+	changed = True
+	while changed:
+		changed = False
+		for i in range(len(merged_boxes)):
+			for j in range(i + 1, len(merged_boxes)):
+				if box_intersect(merged_boxes[i], merged_boxes[j], epsilon=epsilon):
+					a, b = merged_boxes[i], merged_boxes[j]
+					merged_boxes[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+					groups[i] = sorted(groups[i] + groups[j])
+					del merged_boxes[j], groups[j]
+					changed = True
+					break
+			if changed:
+				break
+	return sorted(groups)
+
+
+class SweepMergeBoxesTest(unittest.TestCase):
+	
+	def test_matches_brute_force(self):
+		rng = random.Random(5)
+		for _ in range(30):
+			boxes = list()
+			for _ in range(rng.randint(1, 60)):
+				x, y = rng.uniform(0, 100), rng.uniform(0, 100)
+				# Изредка высокие боксы, что бы проверить отдельный список высоких
+				h = rng.uniform(0, 60) if rng.random() < 0.1 else rng.uniform(0, 6)
+				boxes.append((x, y, x + rng.uniform(0, 6), y + h))
+			epsilon = rng.choice((0.0, 0.5))
+			self.assertEqual(sorted(sweep_merge_boxes(*zip(*boxes), epsilon=epsilon)), brute_merge_boxes(boxes, epsilon=epsilon))
+	
+	def test_touching_boxes_merge(self):
+		boxes = list((float(x), float(y), x + 1.0, y + 1.0) for x in range(5) for y in range(5))
+		self.assertEqual(sweep_merge_boxes(*zip(*boxes)), [list(range(25))])
+	
+	def test_column_scaling(self):
+		# Столбец непересекающихся боксов: все активны одновременно, раньше это давало квадратичное время
+		def column_time(count):
+			boxes = list((0.0, 2.0 * i, 1.0, 2.0 * i + 1.0) for i in range(count))
+			start = time.perf_counter()
+			groups = sweep_merge_boxes(*zip(*boxes))
+			self.assertEqual(len(groups), count)
+			return time.perf_counter() - start
+		
+		small, large = column_time(2000), column_time(16000)
+		# При квадратичном росте отношение было бы около 64
+		self.assertLess(large, 16 * small + 0.05)
+		self.assertLess(large, 2.0)
+
+
+
+class EmitIntensityTest(unittest.TestCase):
+	def test_untextured_is_material_emit(self):
+		# Без текстуры - серый material.emit, как и раньше давал бейк без слотов
+		result = emit_intensity(numpy.zeros((1, 1, 4), dtype=numpy.float32), 0.25)
+		numpy.testing.assert_allclose(result[0, 0], (0.25, 0.25, 0.25, 1.0), atol=1e-6)
+	
+	def test_textured_is_gray_intensity(self):
+		# Белый, чёрный и цветной пиксели: результат серый, цвет текстуры идёт только через яркость
+		pixels = numpy.array([[(1.0, 1.0, 1.0), (0.0, 0.0, 0.0), (1.0, 0.0, 0.0)]], dtype=numpy.float32)
+		result = emit_intensity(pixels, 0.25, factor=0.5)
+		red_tin = 0.2126 * 0.5
+		expected = (0.5 + 0.5 * 0.25, 0.25, red_tin + (1.0 - red_tin) * 0.25)
+		numpy.testing.assert_allclose(result[0, :, 0], expected, atol=1e-6)
+		numpy.testing.assert_allclose(result[0, :, 1], expected, atol=1e-6)
+		numpy.testing.assert_allclose(result[0, :, 2], expected, atol=1e-6)
+		numpy.testing.assert_allclose(result[0, :, 3], 1.0)
+	
+	def test_full_factor_ignores_material_emit(self):
+		# emit_factor = 1 и белая текстура полностью заменяют material.emit на default_value
+		pixels = numpy.ones((2, 2, 4), dtype=numpy.float32)
+		result = emit_intensity(pixels, 0.75, factor=1.0, default_value=0.5)
+		numpy.testing.assert_allclose(result[:, :, 0:3], 0.5, atol=1e-6)
+
+
+if __name__ == '__main__':
+	unittest.main()
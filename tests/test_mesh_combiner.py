@@ -0,0 +1,71 @@
+# Kawashirov's Scripts (c) 2019 by Sergey V. Kawashirov
+#
+# Kawashirov's Scripts is licensed under a
+# Creative Commons Attribution-NonCommercial-ShareAlike 3.0 Unported License.
+#
+# You should have received a copy of the license along with this
+# work.  If not, see <http://creativecommons.org/licenses/by-nc-sa/3.0/>.
+#
+#
+
+# Тесты KawaMeshCombiner, которым нужен bpy. Вне Blender пропускаются, в Blender запускаются так:
+# blender -b --python-exit-code 1 --python-expr "import unittest; unittest.main(module='tests.test_mesh_combiner', exit=False)"
+
+import unittest
+
+try:
+	import bpy
+except ImportError:
+	bpy = None
+
+
+@unittest.skipIf(bpy is None, "requires bpy (run inside Blender)")
+class SplitByMaterialBMeshTest(unittest.TestCase):
+	
+	def setUp(self):
+		# Два квада с общим ребром, у каждого свой материал, и пользовательские нормали, разные у каждого лупа
+		mesh = bpy.data.meshes.new('KawaTestSplitMesh')
+		mesh.from_pydata(
+			[(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0), (2, 0, 0), (2, 1, 0)], [], [(0, 1, 2, 3), (1, 4, 5, 2)]
+		)
+		mesh.materials.append(bpy.data.materials.new('KawaTestSplitA'))
+		mesh.materials.append(bpy.data.materials.new('KawaTestSplitB'))
+		mesh.polygons[1].material_index = 1
+		mesh.uv_textures.new('UVMap')
+		mesh.use_auto_smooth = True
+		self.normals = list()
+		for i in range(len(mesh.loops)):
+			normal = (0.1 * i, 0.05 * i, 1.0)
+			length = sum(c * c for c in normal) ** 0.5
+			self.normals.append(tuple(c / length for c in normal))
+		mesh.normals_split_custom_set(self.normals)
+		self.obj = bpy.data.objects.new('KawaTestSplitObject', mesh)
+		bpy.context.scene.objects.link(self.obj)
+		self.created = list()
+	
+	def tearDown(self):
+		for obj in self.created + [self.obj]:
+			mesh = obj.data
+			bpy.context.scene.objects.unlink(obj)
+			bpy.data.objects.remove(obj)
+			bpy.data.meshes.remove(mesh)
+	
+	def test_custom_normals_survive_split(self):
+		from kawa_scripts.mesh_combiner import KawaMeshCombiner
+		from kawa_scripts.commons import get_custom_normals
+		parts = KawaMeshCombiner.split_by_material_bmesh(self.obj)
+		self.created.extend(parts)
+		self.assertEqual(len(parts), 2)
+		for part, poly in zip(parts, self.obj.data.polygons):
+			self.assertTrue(part.data.use_auto_smooth)
+			self.assertIn('UVMap', part.data.uv_textures.keys())
+			normals = get_custom_normals(part.data)
+			self.assertIsNotNone(normals)
+			self.assertEqual(len(normals), poly.loop_total)
+			for normal, loop in zip(normals.tolist(), poly.loop_indices):
+				for a, b in zip(normal, self.normals[loop]):
+					self.assertAlmostEqual(a, b, places=3)
+
+
+if __name__ == '__main__':
+	unittest.main()